@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+""" 发布大文档的内存峰值评估: 整体序列化（原方式） vs 由行缓冲流式写入请求
+
+    python bench/bench_memory.py [--size-mb 50]
+
+    MetaWeblog模拟服务器运行于子进程，统计结果仅包含发布端的Python内存分配（tracemalloc）
+"""
+
+import os
+import sys
+import json
+import socket
+import shutil
+import tempfile
+import tracemalloc
+import subprocess
+from time import perf_counter, sleep
+
+DIR_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_ROOT)
+
+from cnblog import CnblogManager
+
+
+def make_note(path_md, size_mb):
+    """ 合成大文档: 类似粘贴的日志及生成的表格 """
+    line = "| 2021-12-16 10:00:00 | INFO | worker-3 | <task> done & saved, elapsed=0.125s |\n"
+    with open(path_md, "w", encoding="utf8") as fp:
+        fp.write("# 大文档\n\n## 日志\n\n")
+        for _ in range(size_mb * 1024 * 1024 // len(line)):
+            fp.write(line)
+
+
+def start_server():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, os.path.join(DIR_ROOT, "util", "metaweblog_server.py"),
+                             "--port", str(port)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            sleep(0.1)
+    return proc, f"http://127.0.0.1:{port}/"
+
+
+def post_buffered(mgr, path_md):
+    """ 原发布方式: 拼接完整文本，再由xmlrpc整体序列化 """
+    mgr.md.load_file(path_md)
+    struct_post = {
+        "title": mgr.md.make_title(),
+        "categories": ["[Markdown]"] + mgr.md.metadata["categories"],
+        "description": mgr.md.render(),
+        "mt_keywords": ",".join(mgr.md.metadata["tags"])
+    }
+    mgr.cnblog_server.metaWeblog.newPost(mgr.dict_conf["blog_id"], mgr.dict_conf["username"],
+                                         mgr.dict_conf["password"], struct_post, True)
+
+
+def post_streaming(mgr, path_md):
+    mgr.post_blog(path_md, force=True)
+
+
+def measure(func, mgr, path_md):
+    tracemalloc.start()
+    time_start = perf_counter()
+    func(mgr, path_md)
+    seconds = perf_counter() - time_start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, seconds
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser("bench_memory")
+    parser.add_argument("--size-mb", type=int, default=50, help="文档大小（MB）")
+    args = parser.parse_args()
+
+    dir_repo = tempfile.mkdtemp(prefix="bench_memory_")
+    proc, url = start_server()
+    try:
+        path_conf = os.path.join(dir_repo, ".cnblog.json")
+        with open(path_conf, "w") as fp:
+            json.dump({
+                "blog_url": url,
+                "blog_id": "1", "app_key": "bench", "user_id": "0",
+                "username": "bench", "password": "bench",
+                "blog_dir": dir_repo,
+                "db_file": ".blogs.db",
+                "parse_cache_mb": 0,
+                "rpc_timeout": 600
+            }, fp)
+        path_md = os.path.join(dir_repo, "big.md")
+        make_note(path_md, args.size_mb)
+        size_file = os.path.getsize(path_md)
+
+        mgr = CnblogManager(path_conf)
+        print(f"\n文档大小: {size_file / 1024 / 1024:.1f}MB")
+        for name, func in [("buffered", post_buffered), ("streaming", post_streaming)]:
+            peak, seconds = measure(func, mgr, path_md)
+            print(f"{name:<10s} peak={peak / 1024 / 1024:8.1f}MB  "
+                  f"({peak / size_file:.2f}x file)  {seconds:6.2f}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(dir_repo, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+""" 元数据解析评估: parse_meta_line 与原eval方式的对比
+
+    python bench/bench_meta.py [--number 20000]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from md_parser import parse_meta_line
+
+
+# 典型的hugo格式元数据块
+META_LINES = [
+    'title = "Python数据结构"\n',
+    'description = "列表、字典与集合的实现原理"\n',
+    'date = "2021-12-03"\n',
+    'weight = 5\n',
+    'tags = ["python", "数据结构", "algorithm"]\n',
+    'categories = ["33-python", "3-syntax"]\n',
+    'keywords = ["list", "dict", "set"]\n',
+]
+
+
+def parse_by_eval(line):
+    key, value = line.split("=")
+    return key.strip(), eval(value)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser("bench_meta")
+    parser.add_argument("--number", type=int, default=20000, help="解析的元数据块数量")
+    args = parser.parse_args()
+
+    for line in META_LINES:
+        assert parse_meta_line(line) == parse_by_eval(line), line
+
+    for name, func in [("eval", parse_by_eval), ("parse_meta_line", parse_meta_line)]:
+        seconds = timeit.timeit(lambda: [func(line) for line in META_LINES], number=args.number)
+        print(f"{name:<16s} {seconds:7.3f}s  {args.number / seconds:10.0f} blocks/sec")
+
+
+if __name__ == "__main__":
+    main()
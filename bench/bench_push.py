@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+""" 推送吞吐量评估: 在本地MetaWeblog模拟服务器上推送10/100/1000篇合成笔记
+
+    python bench/bench_push.py [--sizes 10 100 1000] [--latency 0.02]
+"""
+
+import os
+import sys
+import re
+import json
+import shutil
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cnblog import CnblogManager
+from scheduler import AsyncPushEngine
+from transport import KeepAliveTransport, make_server_proxy
+from util.metaweblog_server import MetaWeblogServer
+
+
+class TimedTransport(KeepAliveTransport):
+    """ 记录每次RPC调用的耗时: {method_name: [seconds]} """
+    _re_method = re.compile(rb"<methodName>(.*?)</methodName>")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = {}
+
+    def _timed(self, request_head, func, *args):
+        re_match = self._re_method.search(request_head[:256])
+        name = re_match.group(1).decode() if re_match else "?"
+        time_start = perf_counter()
+        result = func(*args)
+        self.latency.setdefault(name, []).append(perf_counter() - time_start)
+        return result
+
+    def request(self, host, handler, request_body, verbose=False):
+        return self._timed(request_body, super().request,
+                           host, handler, request_body, verbose)
+
+    def request_streaming(self, host, handler, request, verbose=False):
+        return self._timed(request.parts[0], super().request_streaming,
+                           host, handler, request, verbose)
+
+
+def percentile(list_values, p):
+    list_sorted = sorted(list_values)
+    index = min(len(list_sorted) - 1, int(round(p / 100 * (len(list_sorted) - 1))))
+    return list_sorted[index]
+
+
+def make_repo(dir_repo, num_notes, num_lines=200):
+    """ 合成笔记仓库，每篇笔记在同名文件夹下引用一张图像 """
+    list_paths = []
+    for i in range(num_notes):
+        name = f"note_{i:05d}"
+        dir_img = os.path.join(dir_repo, name)
+        os.makedirs(dir_img)
+        with open(os.path.join(dir_img, "img.png"), "wb") as fp:
+            fp.write(os.urandom(32 * 1024))
+        with open(os.path.join(dir_repo, name + ".md"), "w", encoding="utf8") as fp:
+            fp.write(f"# 笔记{i}\n\n[TOC]\n\n## 正文\n\n")
+            fp.write(f"![]({name}/img.png)\n\n")
+            for j in range(num_lines):
+                fp.write(f"第{j}行: lorem ipsum dolor sit amet, consectetur adipiscing elit.\n")
+        list_paths.append(name + ".md")
+    return list_paths
+
+
+def bench(num_notes, latency, workers):
+    dir_repo = tempfile.mkdtemp(prefix="bench_push_")
+    try:
+        with MetaWeblogServer(latency=latency) as server:
+            path_conf = os.path.join(dir_repo, ".cnblog.json")
+            with open(path_conf, "w") as fp:
+                json.dump({
+                    "blog_url": server.url,
+                    "blog_id": "1", "app_key": "bench", "user_id": "0",
+                    "username": "bench", "password": "bench",
+                    "blog_dir": dir_repo,
+                    "db_file": ".blogs.db",
+                    "upload_images": True,
+                    "upload_workers": workers,
+                    "push_workers": workers,
+                    "newpost_interval": 0
+                }, fp)
+            list_paths = make_repo(dir_repo, num_notes)
+
+            mgr = CnblogManager(path_conf)
+            mgr.cnblog_server = make_server_proxy(server.url, timeout=30, pool_size=workers,
+                                                  transport_class=TimedTransport)
+            transport = mgr.cnblog_server("transport")
+
+            engine = AsyncPushEngine(mgr)
+            for path_md in list_paths:
+                engine.add_post(path_md)
+            time_start = perf_counter()
+            engine.run()
+            time_push = perf_counter() - time_start
+
+            num_posts = server.num_calls.get("metaWeblog.newPost", 0)
+            num_images = server.num_calls.get("metaWeblog.newMediaObject", 0)
+            return {
+                "notes": num_notes,
+                "seconds": time_push,
+                "posts/sec": num_posts / time_push,
+                "images/sec": num_images / time_push,
+                "latency": {name: (percentile(v, 50), percentile(v, 95), len(v))
+                            for name, v in transport.latency.items()},
+                "connections": transport.stats(),
+            }
+    finally:
+        shutil.rmtree(dir_repo, ignore_errors=True)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser("bench_push")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.02, help="服务器模拟延迟（秒）")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    list_reports = []
+    for num_notes in args.sizes:
+        list_reports.append(bench(num_notes, args.latency, args.workers))
+
+    print("\n" + "#" * 49)
+    for report in list_reports:
+        print(f"notes={report['notes']:<6d} {report['seconds']:8.2f}s  "
+              f"posts/sec={report['posts/sec']:8.1f}  images/sec={report['images/sec']:8.1f}  "
+              f"connections={report['connections']}")
+        for name, (p50, p95, count) in sorted(report["latency"].items()):
+            print(f"    {name:<28s} n={count:<6d} p50={p50*1000:7.1f}ms  p95={p95*1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from md_parser import MarkdownParser, NullMarkdownFile, MetaSyntaxError
+from util.digest import file_digest
+
+try:
+    from utils.log import getLogger
+except ImportError:
+    from logging import getLogger
+logger = getLogger()
+
+
+def _scan_note(task):
+    """ 进程池任务: (path_abs, path_rel, size, mtime_ns, digest_old) -> (status, data)
+        status: "parsed" | "touched"（内容未变化） | "error"
+    """
+    path_abs, path_rel, size, mtime_ns, digest_old = task
+    try:
+        digest = file_digest(path_abs)
+        if digest == digest_old:
+            return "touched", (path_rel, size, mtime_ns)
+
+        md = MarkdownParser()
+        md.load_file(path_abs)
+        list_images = list(md.get_images("local", force_abspath=False).values())
+        list_images += list(md.get_images("http").values())
+        return "parsed", {
+            "filepath": path_rel,
+            "title": md.make_title(),
+            "tags": md.metadata.get("tags"),
+            "categories": md.metadata.get("categories"),
+            "weight": md.metadata.get("weight"),
+            "images": list_images,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "digest": digest,
+        }
+    except (NullMarkdownFile, MetaSyntaxError, UnicodeDecodeError, ValueError, OSError) as e:
+        return "error", (path_rel, f"{type(e).__name__}: {e}")
+
+
+class CatalogBuilder:
+    """ 并行解析blog_dir下的全部.md文档，写入数据库的catalog表
+        重复执行时，仅重新解析 size/mtime 变化且内容hash变化的文档
+    """
+    def __init__(self, cnblog_mgr, num_workers=None):
+        self.dir_blog = os.path.expanduser(cnblog_mgr.get_blogdir())
+        self.db = cnblog_mgr.db
+        if num_workers is None:
+            num_workers = cnblog_mgr.dict_conf.get("catalog_workers", os.cpu_count() or 1)
+        self.num_workers = max(1, int(num_workers))
+
+    def walk(self):
+        """ yield (path_abs, path_rel)，跳过隐藏目录（.git、缓存等） """
+        for dir_path, list_dirs, list_files in os.walk(self.dir_blog):
+            list_dirs[:] = [d for d in list_dirs if not d.startswith(".")]
+            for file_name in list_files:
+                if file_name.endswith(".md"):
+                    path_abs = os.path.join(dir_path, file_name)
+                    path_rel = os.path.relpath(path_abs, self.dir_blog).replace(os.sep, "/")
+                    yield path_abs, path_rel
+
+    def build(self):
+        dict_stamps = self.db.get_catalog_stamps()
+        list_tasks = []
+        set_found = set()
+        for path_abs, path_rel in self.walk():
+            try:
+                stat = os.stat(path_abs)
+            except OSError:  # 遍历后即被删除
+                continue
+            set_found.add(path_rel)
+            stamp = dict_stamps.get(path_rel)
+            if stamp and stamp[:2] == (stat.st_size, stat.st_mtime_ns):
+                continue
+            list_tasks.append((path_abs, path_rel, stat.st_size, stat.st_mtime_ns,
+                               stamp[2] if stamp else None))
+
+        list_parsed, list_touched, list_errors = [], [], []
+        if list_tasks:
+            chunksize = max(1, len(list_tasks) // (self.num_workers * 4))
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                for status, data in executor.map(_scan_note, list_tasks, chunksize=chunksize):
+                    {"parsed": list_parsed,
+                     "touched": list_touched,
+                     "error": list_errors}[status].append(data)
+
+        list_removed = list(set(dict_stamps) - set_found)
+        with self.db.transaction():
+            self.db.upsert_catalog(list_parsed)
+            self.db.update_catalog_stamps(list_touched)
+            self.db.del_catalog(list_removed)
+
+        for path_rel, str_error in list_errors:
+            logger.warning(f"文档解析失败【{path_rel}】: {str_error}")
+        dict_stats = {
+            "total": len(set_found),
+            "parsed": len(list_parsed),
+            "touched": len(list_touched),
+            "removed": len(list_removed),
+            "errors": len(list_errors),
+        }
+        print(f">> 完成目录索引: {dict_stats}")
+        return dict_stats
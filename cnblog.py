@@ -8,11 +8,18 @@ import os
 import shutil
 from pathlib import Path
 import json
+import mimetypes
+import threading
 import xmlrpc.client
-from time import sleep
+from time import sleep, perf_counter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
-from md_parser import MarkdownParser
-from data import ArticlesDB
+from md_parser import MarkdownParser, DocumentCache
+from data import ArticlesDB, ImagesDB
+from transport import make_server_proxy, Base64File, TextStream
+from img_optimizer import ImageOptimizer
+from renderer import HtmlRenderer, RenderError
+from util.digest import file_digest, text_digest, stream_digest
 
 try:
     from utils.log import getLogger
@@ -22,6 +29,8 @@ logger = getLogger()
 
 
 TIME_FOR_FREQUENCE_LIMIT = 5
+SEARCH_BODY_KB = 256  # 全文索引的正文长度上限（粘贴的日志等超大文档仅索引开头部分）
+MAX_IMAGE_MB = 10  # 服务器端图像大小限制
 TESTING = False
 if TESTING:
     print("\n" + "#"*49)
@@ -32,6 +41,12 @@ if TESTING:
 class PostidNotUnique(Exception):
     """ 获取到postid不唯一，可能是存在同名title的文档 """
 
+class FrequencyLimited(Exception):
+    """ <Fault 500: '30秒内只能发布1篇博文，请稍候发布'> """
+
+class ImageUploadError(Exception):
+    """ 图像上传失败（并发上传中任一图像失败即终止） """
+
 class CnblogManager:
     def __init__(self, path_cnblog_account):
         self.dict_conf = {
@@ -41,18 +56,69 @@ class CnblogManager:
             # "user_id" : "",
             # "username": "",
             # "password": "",
-            # "repo_dir": ""
+            # "repo_dir": "",
+            # "upload_workers": 4,
+            # "img_cache": ".images.db",
+            # "rpc_timeout": 60,
+            # "rpc_pool_size": 4,
+            # "push_workers": 4,
+            # "backup_workers": 8,
+            # "max_image_mb": 10,
+            # "image_optimize": {"enable": False, "workers": 4, "cache_dir": ".img_optimized",
+            #                    "png": {"max_width": 1600}, "jpg": {"quality": 85}},
+            # "parse_cache_mb": 64,
+            # "search_body_kb": 256,
+            # "db_pragmas": {"synchronous": "NORMAL", "cache_size": -16000, "mmap_size": 67108864},
+            # "render_html": {"enable": False, "cache_dir": ".html_rendered",
+            #                 "extensions": ["extra", "sane_lists", "toc"]},
+            # "catalog_workers": 8
         }
         self.load_cnblog_conf(path_cnblog_account)
         self.dir_blog = self.get_blogdir()
-        self.cnblog_server = xmlrpc.client.ServerProxy(self.dict_conf["blog_url"])
+        # keep-alive连接池，可供上传线程共享
+        self.cnblog_server = make_server_proxy(
+                self.dict_conf["blog_url"],
+                timeout=self.dict_conf.get("rpc_timeout", 60),
+                pool_size=self.dict_conf.get("rpc_pool_size",
+                                             self.dict_conf.get("upload_workers", 4)))
         self.mime = None
 
-        self.md = MarkdownParser()
+        self._local = threading.local()
+        self._prompt_lock = threading.Lock()  # 推送时多个工作线程可能同时询问用户
+        self.doc_cache = DocumentCache(int(self.dict_conf.get("parse_cache_mb", 64) * 1024 * 1024))
         path_db = os.path.join(self.get_blogdir(), self.get_dbpath())
-        self.db = ArticlesDB(os.path.expanduser(path_db))
+        self.db = ArticlesDB(os.path.expanduser(path_db), self.dict_conf.get("db_pragmas"))
+        path_img_cache = os.path.join(self.get_blogdir(), self.get_img_cache_path())
+        self.img_cache = ImagesDB(os.path.expanduser(path_img_cache))
+        self.img_optimizer = None
+        conf_optimize = self.dict_conf.get("image_optimize", {})
+        if conf_optimize.get("enable"):
+            dir_optimized = conf_optimize.get("cache_dir") or os.path.join(
+                                os.path.dirname(self.get_dbpath()), ".img_optimized")
+            dir_optimized = os.path.expanduser(os.path.join(self.get_blogdir(), dir_optimized))
+            self.img_optimizer = ImageOptimizer(dir_optimized, conf_optimize)
+        self.renderer = None
+        conf_render = self.dict_conf.get("render_html", {})
+        if conf_render.get("enable"):
+            dir_rendered = conf_render.get("cache_dir") or os.path.join(
+                                os.path.dirname(self.get_dbpath()), ".html_rendered")
+            dir_rendered = os.path.expanduser(os.path.join(self.get_blogdir(), dir_rendered))
+            self.renderer = HtmlRenderer(dir_rendered, conf_render)
         # self.md.set_ignore_websites(["cnblogs.com/blog/" + self.dict_conf["user_id"]])
 
+    def close(self):
+        """ 释放图像压缩的进程池 """
+        if self.img_optimizer:
+            self.img_optimizer.close()
+
+    @property
+    def md(self):
+        """ 每个线程独立的MarkdownParser（供推送引擎并发发布） """
+        md = getattr(self._local, "md", None)
+        if md is None:
+            md = self._local.md = MarkdownParser(cache=self.doc_cache)
+        return md
+
     def check_repo(self):
         repo_dir = self.get_blogdir()
         assert os.path.isabs(repo_dir), "[blog_dir]必须为绝对路径"
@@ -71,6 +137,13 @@ class CnblogManager:
     def get_dbpath(self):
         return self.dict_conf.get("db_file")
 
+    def get_img_cache_path(self):
+        """ 图像上传缓存，默认与db_file存放于同一目录 """
+        path_cache = self.dict_conf.get("img_cache")
+        if not path_cache:
+            path_cache = os.path.join(os.path.dirname(self.get_dbpath()), ".images.db")
+        return path_cache
+
     def get_abspath(self, path_rel):
         return os.path.join(self.dir_blog, path_rel)
 
@@ -91,6 +164,10 @@ class CnblogManager:
                             self.dict_conf["password"])
         return user_info
 
+    def get_transport_stats(self):
+        """ 连接复用统计: {"opened": n, "reused": m} """
+        return self.cnblog_server("transport").stats()
+
     def pull_img(self, path_md):
         self.md.load_file(path_md)
 
@@ -106,31 +183,74 @@ class CnblogManager:
         # file_name = format_ext(file_name)
         _, suffix = os.path.splitext(file_name)
 
-        try:
-            type_ = self.mime[suffix]
-        except KeyError:
+        type_ = (self.mime or {}).get(suffix) or mimetypes.guess_type(file_name)[0]
+        if not type_:
             logger.error(f"未定义的扩展名类型【{suffix}】，使用默认值'image/jpeg'")
             type_ = "image/jpeg"
 
-        with open(path_img, 'rb') as fp:
-            file = {
-                "bits": fp.read(),
-                "name": file_name,
-                "type": type_
-            }
-        url_new = self.cnblog_server.metaWeblog.newMediaObject(
+        # 内容未变化的图像，直接复用已上传的url
+        digest = file_digest(path_img)
+        url_cached = self.img_cache.get_url(digest)
+        if url_cached:
+            return url_cached
+
+        # 流式base64编码上传，内存占用与图像大小无关
+        bits = Base64File(path_img)
+        max_mb = self.dict_conf.get("max_image_mb", MAX_IMAGE_MB)
+        if bits.size > max_mb * 1024 * 1024:
+            logger.warning(f"图像大小{bits.size / 1024 / 1024:.1f}MB超出服务器限制({max_mb}MB)，上传可能失败:【{path_img}】")
+        file = {
+            "bits": bits,
+            "name": file_name,
+            "type": type_
+        }
+        url_new = self.cnblog_server.call_streaming(
+                    "metaWeblog.newMediaObject",
                     self.dict_conf["blog_id"],
                     self.dict_conf["username"],
                     self.dict_conf["password"],
                     file)
+        self.img_cache.set_url(digest, url_new["url"], file_name, bits.size)
         return url_new["url"]
 
+    def _upload_images(self, dict_images):
+        """ 并发上传图像: {line_idx: path_img} -> {line_idx: url_new}
+            线程数由配置项"upload_workers"指定；任一图像上传失败，
+            则取消剩余任务并抛出ImageUploadError，不修改文本
+        """
+        num_workers = max(1, int(self.dict_conf.get("upload_workers", 4)))
+
+        def upload(path_img):
+            time_start = perf_counter()
+            url_new = self._upload_img(path_img)
+            return url_new, perf_counter() - time_start
+
+        dict_urls = {}
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(upload, path_img): line_idx
+                       for line_idx, path_img in dict_images.items()}
+            for future in as_completed(futures):
+                line_idx = futures[future]
+                path_img = dict_images[line_idx]
+                try:
+                    url_new, latency = future.result()
+                except Exception as e:
+                    for f in futures:
+                        f.cancel()
+                    raise ImageUploadError(f"图像上传失败【{path_img}】: {e}") from e
+                print(f">> 完成图像的上传:【{os.path.basename(path_img)}】{latency:.2f}s")
+                dict_urls[line_idx] = url_new
+        print(f">> 图像缓存命中率: {self.img_cache.hit_rate():.0%} "
+              f"({self.img_cache.hits}/{self.img_cache.hits + self.img_cache.misses})")
+        return dict_urls
+
     def _load_mime(self):
         with open("mime.json", "r") as fp:
             self.mime = json.load(fp)
 
-    def _new_blog(self, struct_post):
-        postid = self.cnblog_server.metaWeblog.newPost(
+    def _new_blog(self, struct_post, digest=None):
+        postid = self.cnblog_server.call_streaming(
+                        "metaWeblog.newPost",
                         self.dict_conf["blog_id"],
                         self.dict_conf["username"],
                         self.dict_conf["password"],
@@ -141,11 +261,13 @@ class CnblogManager:
                                 self.md.make_title(),
                                 self.md.metadata.get("date"),
                                 self.md.metadata.get("tags"),
-                                self.md.metadata.get("weight"))
+                                self.md.metadata.get("weight"),
+                                digest)
 
-    def _repost_blog(self, postid, struct_post):
+    def _repost_blog(self, postid, struct_post, digest=None):
         """ 重新发布 """
-        status = self.cnblog_server.metaWeblog.editPost(
+        status = self.cnblog_server.call_streaming(
+                        "metaWeblog.editPost",
                         postid,
                         self.dict_conf["username"],
                         self.dict_conf["password"],
@@ -156,7 +278,8 @@ class CnblogManager:
                                 self.md.make_title(),
                                 self.md.metadata.get("date"),
                                 self.md.metadata.get("tags"),
-                                self.md.metadata.get("weight"))
+                                self.md.metadata.get("weight"),
+                                digest)
 
     def _is_article(self, path_md):
         abspath_article = os.path.join(self.db.repo_dir, self.db.data["dir_article"])
@@ -183,7 +306,16 @@ class CnblogManager:
         else:
             return False  # 无需更新
 
-    def _rebuild_images(self, path_md):
+    def _confirm(self, prompt):
+        """ 询问用户（默认Y）；加锁，避免并发推送时多个提示交错 """
+        with self._prompt_lock:
+            return input(prompt).lower() != "n"
+
+    def _rebuild_images(self, path_md, dict_stamps=None):
+        """ dict_stamps: 上次发布时各图像的 {rel_path: (size, mtime_ns, url)}，
+            大小及修改时间均未变化的图像直接复用上次的url，不再计算hash、压缩或上传
+            return: 本次各图像的 {rel_path: (size, mtime_ns, url)}
+        """
         dir_img = path_md[:-3]  # 同名文件夹
         has_dir = os.path.exists(dir_img)
 
@@ -192,7 +324,7 @@ class CnblogManager:
         if not has_dir:
             assert not dict_images_relpath, f"Markdown文档引用的图像未存储在同名文件夹下: {dict_images_relpath}"
             self.md.unlock_text()
-            return False
+            return {}
 
         # 删除未被引用的（多余）图像
         list_dir = os.listdir(dir_img)
@@ -200,27 +332,42 @@ class CnblogManager:
         dict_images_local = {**dict_images_relpath, **dict_images_backup}
         if not dict_images_local:
             self.md.unlock_text()
-            logger.warning(f"Markdown文档并未引用本地图像，同名dir内容如下: {list_dir}")
-            if input("是否清除同名文件夹？ [Y/n]: ").lower() != "n":
+            if self._confirm(f"Markdown文档并未引用本地图像，同名dir内容如下: {list_dir}\n"
+                             f"是否清除同名文件夹【{dir_img}】？ [Y/n]: "):
                 shutil.rmtree(dir_img)
                 logger.warning(f"已清除未引用文件夹:【{dir_img}】")
-            return False
+            return {}
 
         set_redundant = set(list_dir) - {os.path.basename(i) for i in dict_images_local.values()}
         str_redundant = '\n'.join(set_redundant)
-        if set_redundant and input(f"""################ 是否删除多余图片文件：
+        if set_redundant and self._confirm(f"""################ 是否删除多余图片文件【{path_md}】：
 {str_redundant}
-################ [Y/n]:""").lower() != "n":
+################ [Y/n]:"""):
             for file in set_redundant:
                 os.remove(os.path.join(dir_img, file))
 
-        # 将图像链接地址改写为cnblog_link
-        dict_images = {}
+        # 未变化的图像复用上次的url，其余图像（压缩后）上传
+        dict_stamps = dict_stamps or {}
+        dict_stats, dict_urls, dict_images = {}, {}, {}
         dir_md = os.path.dirname(path_md)
-        # if dict_images_relpath:
         for line_idx, rel_path in dict_images_relpath.items():
-            dict_images[line_idx] = os.path.join(dir_md, rel_path)
-        self.md.process_images(dict_images, self._upload_img)
+            path_img = os.path.join(dir_md, rel_path)
+            stat = os.stat(path_img)
+            dict_stats[rel_path] = (stat.st_size, stat.st_mtime_ns)
+            stamp = dict_stamps.get(rel_path)
+            if stamp and tuple(stamp[:2]) == dict_stats[rel_path]:
+                dict_urls[line_idx] = stamp[2]
+            else:
+                dict_images[line_idx] = path_img
+        if self.img_optimizer and dict_images:
+            # 压缩后的图像保持原文件名
+            dict_upload = self.img_optimizer.optimize(list(dict_images.values()))
+            dict_images = {idx: dict_upload[path] for idx, path in dict_images.items()}
+        if dict_images:
+            dict_urls.update(self._upload_images(dict_images))
+
+        # 将图像链接地址改写为cnblog_link
+        self.md.replace_images(dict_urls)
 
         # 备注原本地图像链接
         text_lines = self.md.get_text()
@@ -228,14 +375,50 @@ class CnblogManager:
         for line, url_local in dict_images_relpath.items():
             # path_rel = os.path.relpath(url_local, self.md.file_name)
             self.md.modify_text(line, f"{text_lines[line].rstrip()} <!-- {url_local} -->")
-        return True
-
-    def post_blog(self, path_md, postid=None):
+        return {rel_path: (*dict_stats[rel_path], dict_urls[line_idx])
+                for line_idx, rel_path in dict_images_relpath.items()}
+
+    @staticmethod
+    def _iter_normalized(list_lines):
+        """ 逐行生成规范化的正文: 忽略行尾空白及首尾空行 """
+        begin, end = 0, len(list_lines)
+        while begin < end and not list_lines[begin].strip():
+            begin += 1
+        while end > begin and not list_lines[end -1].strip():
+            end -= 1
+        if begin < end:
+            yield list_lines[begin].strip()
+        for index in range(begin +1, end):
+            yield "\n" + list_lines[index].rstrip()
+
+    @classmethod
+    def _digest_post(cls, struct_post):
+        """ 发布内容的hash；description为TextStream时逐行计算 """
+        description = struct_post["description"]
+        if isinstance(description, TextStream):
+            list_lines = description.lines
+        else:
+            list_lines = description.splitlines()
+        return stream_digest(struct_post["title"],
+                             cls._iter_normalized(list_lines),
+                             ",".join(struct_post["categories"]),
+                             struct_post["mt_keywords"])
+
+    def post_blog(self, path_md, postid=None, wait_limit=True, force=False):
+        """ wait_limit: 遇到发布频率限制时，是否原地等待重试；
+            否则抛出FrequencyLimited，由调用者（AsyncPushEngine）调度
+            force: 即使内容与上次发布一致，也重新发布
+        """
         # if self.mime is None:
         #     self._load_mime()
         self.md.load_file(self.get_abspath(path_md))
-        # # 图片的处理
-        # self._rebuild_images(path_md)
+        path_rel = self.get_relpath(self.md.file_path)
+        upload_images = self.dict_conf.get("upload_images")
+        if upload_images:
+            # 图片的处理（增量: 仅上传相对上次发布有变化的图像）
+            dict_stamps = self._rebuild_images(self.md.file_path, self.db.get_image_stamps(path_rel))
+            # 记录的url均已上传成功，无论本次发布是否成功均可复用
+            self.db.set_image_stamps(path_rel, dict_stamps)
         # # 更新category
         # self._update_categories(path_md)
         # # 保存修改url的Markdown
@@ -246,25 +429,42 @@ class CnblogManager:
         #     self.md.metadata["categories"] = ["[文章分类]"] + self.md.metadata["categories"]
 
         blog_title = self.md.make_title()
+        if self.renderer:
+            # 本地渲染为HTML：发布前即可发现'<xxx>'等格式错误
+            try:
+                description = self.renderer.render(self.md.render())
+            except RenderError as e:
+                raise Exception(f"数据格式错误【{path_rel}】: {e}")
+            categories = self.md.metadata["categories"]
+        else:
+            # 直接由行缓冲流式写入请求，不生成完整的文本副本
+            description = TextStream(self.md.get_text())
+            categories = ["[Markdown]"] + self.md.metadata["categories"]
         struct_post = {
             "title": blog_title,
-            "categories": ["[Markdown]"] + self.md.metadata["categories"],
-            "description": "".join(self.md.get_text()),
+            "categories": categories,
+            "description": description,
             'mt_keywords': ",".join(self.md.metadata["tags"])
         }
 
         if not postid:
-            postid = self.db.get_postid(path=self.md.file_path)
+            postid = self.db.get_postid(path=path_rel)
+        digest = self._digest_post(struct_post)
         if postid:
-            self._repost_blog(postid, struct_post)
+            if not force and digest == self.db.get_digest(postid=postid):
+                print(f">> 内容未变化，跳过blog的更新:【{postid}】")
+                return
+            self._repost_blog(postid, struct_post, digest)
         else:
             while True:
                 try:
-                    self._new_blog(struct_post)
+                    self._new_blog(struct_post, digest)
                 except xmlrpc.client.Fault as e:
                     err_type = str(e).split(':', 1)[0]
                     if err_type == "<Fault 500":
                         # <Fault 500: '30秒内只能发布1篇博文，请稍候发布，联系邮箱：contact@cnblogs.com'>
+                        if not wait_limit:
+                            raise FrequencyLimited(str(e))
                         print(f"cnblog限制了发送频率，请静候{TIME_FOR_FREQUENCE_LIMIT}s\n程序正在后台运行，请勿退出...")
                         sleep(TIME_FOR_FREQUENCE_LIMIT)
                     elif err_type == "<Fault 0":
@@ -274,6 +474,33 @@ class CnblogManager:
                 else:
                     break
 
+        self._index_post(path_rel, blog_title)
+
+    def _index_post(self, path_rel, blog_title):
+        """ 由行缓冲截取正文（不超过search_body_kb），更新全文索引 """
+        max_chars = self.dict_conf.get("search_body_kb", SEARCH_BODY_KB) * 1024
+        list_body, num_chars = [], 0
+        for line in self.md.get_text():
+            if num_chars >= max_chars:
+                break
+            list_body.append(line)
+            num_chars += len(line)
+        self.db.index_post(path_rel, blog_title, self.md.metadata["tags"], "".join(list_body))
+
+    def reindex_blogs(self):
+        """ 重建全部已发布文章的全文索引（如升级前已发布的文章） """
+        num_indexed = 0
+        with self.db.transaction():
+            for path_rel, *_ in self.db.select():
+                path_md = self.get_abspath(path_rel)
+                if not os.path.exists(path_md):
+                    logger.warning(f"文档不存在，跳过索引:【{path_rel}】")
+                    continue
+                self.md.load_file(path_md)
+                self._index_post(path_rel, self.md.make_title())
+                num_indexed += 1
+        print(f">> 已重建全文索引: {num_indexed}篇")
+
     def download_blog(self, title_or_postid, ignore_img=True):
         if not ignore_img:
             raise Exception("尚未开发，敬请期待")
@@ -284,18 +511,114 @@ class CnblogManager:
 但不确定博客园服务器状态。如有必要，请指定postid值，重新查询。")
             return
 
-        dict_data = self.cnblog_server.metaWeblog.getPost(
+        dict_data = self._get_post(postid)
+        path_save = self._save_post("cnblog_bak", postid, dict_data)
+        print(f">> 已下载blog:【{path_save}】")
+
+    def _get_post(self, postid):
+        return self.cnblog_server.metaWeblog.getPost(
                     postid,
                     self.dict_conf["username"],
                     self.dict_conf["password"])
 
-        dir_download = "cnblog_bak"
+    def _save_post(self, dir_download, postid, dict_data):
         if not os.path.exists(dir_download):
             os.makedirs(dir_download)
         path_save = f"{dir_download}/{postid}.md"
         with open(path_save, "w", encoding="utf8") as fp:
             fp.write(dict_data['description'])
-        print(f">> 已下载blog:【{path_save}】")
+        return path_save
+
+    def backup_blog(self, dir_backup="cnblog_bak", num_recent=20, force=False):
+        """ 增量备份全部blog至dir_backup
+            - 待备份列表: 本地数据库中的postid，及getRecentPosts(num_recent)返回的近期blog
+              （MetaWeblog没有分页接口，且列表中包含正文，故仅检查最近num_recent篇）
+            - 本地发布的blog: 跳过上次备份后未重新发布的（比较数据库中的发布hash）
+            - 其余blog（近期列表中的，或数据库中没有发布hash的）: 比较正文hash，
+              由此发现在博客园上直接修改的内容；近期列表之外的此类修改无法发现
+            - 线程池并发getPost，完成一篇即写入一篇，并追加记录至.manifest.jsonl，
+              中断后重新执行即可断点续传
+        """
+        path_manifest = os.path.join(dir_backup, ".manifest.jsonl")
+        dict_manifest = {}  # postid: record
+        if os.path.exists(path_manifest) and not force:
+            with open(path_manifest, "r", encoding="utf8") as fp:
+                for line in fp:
+                    record = json.loads(line)
+                    dict_manifest[record["postid"]] = record
+        os.makedirs(dir_backup, exist_ok=True)
+
+        dict_digests = self.db.get_digests()  # postid: 发布hash
+
+        def get_record(postid):
+            record = dict_manifest.get(postid)
+            if record and os.path.exists(os.path.join(dir_backup, record["file"])):
+                return record
+
+        def is_backed_up(postid):
+            record = get_record(postid)
+            digest = dict_digests.get(postid)
+            return bool(record and digest and record["published"] == digest)
+
+        num_saved = 0
+        with open(path_manifest, "a", encoding="utf8") as fp_manifest:
+            def save(postid, dict_data):
+                """ return 是否写入（正文与上次备份一致时跳过） """
+                digest_body = text_digest(dict_data["description"])
+                record = get_record(postid)
+                if record and record.get("body") == digest_body and \
+                        record["published"] == dict_digests.get(postid):
+                    return False
+                path_save = self._save_post(dir_backup, postid, dict_data)
+                date_created = dict_data.get("dateCreated")
+                record = {
+                    "postid": postid,
+                    "file": os.path.basename(path_save),
+                    "published": dict_digests.get(postid),
+                    "body": digest_body,
+                    "date": str(date_created) if date_created else None,
+                    "title": dict_data.get("title"),
+                }
+                fp_manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+                fp_manifest.flush()
+                dict_manifest[postid] = record
+                print(f">> 已备份blog:【{path_save}】")
+                return True
+
+            # 近期blog（可能并非由本工具发布），返回值已包含正文，无需再次getPost
+            set_recent = set()
+            if num_recent:
+                for dict_data in self.get_recent_post(num_recent):
+                    postid = str(dict_data["postid"])
+                    set_recent.add(postid)
+                    num_saved += save(postid, dict_data)
+
+            list_todo = [postid for postid in dict_digests
+                         if postid not in set_recent and not is_backed_up(postid)]
+            print(f">> 待备份blog: {len(list_todo)}篇（已跳过{len(dict_digests) - len(list_todo)}篇）")
+
+            # 有界提交: 同时最多持有num_workers*2个未写入的结果
+            num_workers = max(1, int(self.dict_conf.get("backup_workers", 8)))
+            iter_todo = iter(list_todo)
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                pending = {}
+                for postid in iter_todo:
+                    pending[executor.submit(self._get_post, postid)] = postid
+                    if len(pending) >= num_workers * 2:
+                        break
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        postid = pending.pop(future)
+                        try:
+                            num_saved += save(postid, future.result())
+                        except xmlrpc.client.Fault as e:
+                            logger.error(f"备份blog失败【{postid}】: {e}")
+                        postid_next = next(iter_todo, None)
+                        if postid_next:
+                            pending[executor.submit(self._get_post, postid_next)] = postid_next
+        print(f">> 完成备份: {num_saved}篇")
+        return num_saved
 
     def delete_blog(self, path_file):
         """ postid: str_id or path_file """
@@ -317,10 +640,11 @@ class CnblogManager:
 
         self.db.del_item(path_file)
 
-    def move_blog(self, path_from, path_to):
+    def move_blog(self, path_from, path_to, force=False):
         postid = self.db.get_postid(path_from)
-        self.post_blog(path_to, postid=postid)
+        # 先更新路径，否则update_item会与旧路径的postid冲突
         self.db.update_filepath(path_from, path_to)
+        self.post_blog(path_to, postid=postid, force=force)
 
     def get_recent_post(self, num=9999):
         """
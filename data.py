@@ -3,76 +3,722 @@
 # @Author  : Bright (brt2@qq.com)
 # @Link    : https://gitee.com/brt2
 
+import re
+import json
+import queue
+import unicodedata
 import sqlite3
+import threading
+from concurrent.futures import Future
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 默认的连接参数，可由配置项"db_pragmas"覆盖
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",  # 读写互不阻塞
+    "synchronous": "NORMAL",  # WAL模式下仅checkpoint时fsync
+    "cache_size": -16000,  # 负数单位为KB
+    "mmap_size": 64 << 20,
+    "busy_timeout": 5000,  # ms
+}
+
+
+def normalize_title(title):
+    """ 标题的规范形式，用于按标题查询: 全半角统一、忽略大小写及多余空白 """
+    return " ".join(unicodedata.normalize("NFKC", title or "").casefold().split())
+
+
+_re_word_run = re.compile(r"[^\W_]+")
+
+
+def short_grams(text):
+    """ 短词索引的分词结果: 各连续字母/数字串的二元组，及串尾的单字（以空格分隔）
+        unicode61分词后，1~2个字符的词即可按子串匹配（二元组表的插入与删除须使用相同的结果）
+    """
+    list_grams = []
+    for run in _re_word_run.findall((text or "").lower()):
+        list_grams.extend(run[i:i +2] for i in range(len(run) -1))
+        list_grams.append(run[-1])
+    return " ".join(list_grams)
+
+
+# 数据库结构的版本迁移: [(version, func(conn))]，按版本顺序执行；
+# 已发布的迁移不可修改，结构变化须追加新的迁移。
+# 无版本记录的旧版数据库从0开始执行，因此各迁移须兼容已存在的表/列
+MIGRATIONS = []
+# 新增列的分批回填: [(table, column, source_column, func(source_value))]
+BACKFILLS = []
+BACKFILL_BATCH = 1000
+
+
+def migration(version):
+    def register(func):
+        assert not MIGRATIONS or version > MIGRATIONS[-1][0], "迁移须按版本顺序定义"
+        MIGRATIONS.append((version, func))
+        return func
+    return register
+
+
+def _add_column(conn, table, column, type_):
+    list_columns = [i[1] for i in conn.execute(f"PRAGMA table_info({table}); ")]
+    if column not in list_columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {type_}; ")
+
+
+@migration(1)
+def _create_essay(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS essay (
+        filepath CHAR(200) NOT NULL PRIMARY KEY
+        , postid CHAR(24) NOT NULL
+        , title CHAR(100) NOT NULL
+        , mdate CHAR(11)
+        , tags TEXT
+        , weight INTEGER default 5
+        , UNIQUE (postid)
+    ); """)
+
+
+@migration(2)
+def _add_essay_digest(conn):
+    """ 发布内容的hash，未变化时跳过更新 """
+    _add_column(conn, "essay", "digest", "CHAR(40)")
+
+
+@migration(3)
+def _create_catalog(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalog (
+        filepath CHAR(200) NOT NULL PRIMARY KEY
+        , title CHAR(100)
+        , tags TEXT
+        , categories TEXT
+        , weight INTEGER
+        , images TEXT
+        , size INTEGER
+        , mtime_ns INTEGER
+        , digest CHAR(40)
+    ); """)
+
+
+@migration(4)
+def _create_snapshot(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS snapshot (
+        filepath CHAR(200) NOT NULL PRIMARY KEY
+        , source TEXT
+        , rewritten TEXT
+    ); """)
+
+
+@migration(5)
+def _add_essay_title_norm(conn):
+    """ 规范化的标题及索引，供按标题查询 """
+    _add_column(conn, "essay", "title_norm", "CHAR(100)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_essay_title_norm ON essay (title_norm); ")
+
+BACKFILLS.append(("essay", "title_norm", "title", normalize_title))
+
+
+@migration(6)
+def _create_essay_fts(conn):
+    """ 已发布文章的全文索引，rowid与essay一致；trigram分词支持中文的子串查询 """
+    list_options = [i[0] for i in conn.execute("PRAGMA compile_options; ")]
+    if "ENABLE_FTS5" not in list_options:
+        return  # 未编译FTS5的sqlite，不提供全文检索
+    tokenize = "trigram" if sqlite3.sqlite_version_info >= (3, 34) else "unicode61"
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS essay_fts "
+                 f"USING fts5(title, tags, body, tokenize='{tokenize}'); ")
+
+
+@migration(7)
+def _create_image_stamp(conn):
+    """ 以各图像上次发布时的 (size, mtime_ns, url) 取代全文快照: 数据库随仓库提交，不再存储正文 """
+    conn.execute("DROP TABLE IF EXISTS snapshot; ")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS image_stamp (
+        filepath CHAR(200) NOT NULL
+        , image TEXT NOT NULL
+        , size INTEGER
+        , mtime_ns INTEGER
+        , url TEXT NOT NULL
+        , PRIMARY KEY (filepath, image)
+    ); """)
+
+
+@migration(8)
+def _create_essay_grams(conn):
+    """ trigram无法匹配少于3个字符的词（如中文的双字词），另建二元组索引；
+        contentless表（content=''），不存储文本，删除时由essay_fts中的原文重新生成二元组
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'essay_fts'; ").fetchone():
+        return
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS essay_grams "
+                 "USING fts5(title, tags, body, content='', tokenize='unicode61'); ")
+    list_rows = conn.execute("SELECT rowid, title, tags, body FROM essay_fts; ").fetchall()
+    conn.executemany("INSERT INTO essay_grams (rowid, title, tags, body) VALUES (?, ?, ?, ?); ",
+                     [(rowid, *map(short_grams, columns)) for rowid, *columns in list_rows])
+
+
+def backfill(conn, table, column, source_column, func, batch_size=BACKFILL_BATCH):
+    """ 按rowid分批回填新增列，每批单独提交：
+        不长时间占用写锁，中断后重新打开数据库时从未回填的行继续
+    """
+    SQL_select = f"SELECT rowid, {source_column} FROM {table} " \
+                 f"WHERE rowid > ? AND {column} IS NULL ORDER BY rowid LIMIT ?; "
+    SQL_update = f"UPDATE {table} SET {column} = ? WHERE rowid = ?; "
+    rowid_last, num_rows = 0, 0
+    while True:
+        list_rows = conn.execute(SQL_select, (rowid_last, batch_size)).fetchall()
+        if not list_rows:
+            break
+        conn.executemany(SQL_update, [(func(value), rowid) for rowid, value in list_rows])
+        conn.commit()
+        rowid_last = list_rows[-1][0]
+        num_rows += len(list_rows)
+    return num_rows
+
+
+def migrate(conn):
+    """ 执行未应用的迁移（同一事务，失败时整体回滚），再回填新增列 """
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL); ")
+    item = conn.execute("SELECT max(version) FROM schema_version; ").fetchone()
+    version = item[0] or 0
+    version_latest = MIGRATIONS[-1][0]
+    if version > version_latest:
+        raise RuntimeError(f"数据库版本(v{version})高于程序支持的版本(v{version_latest})，请升级程序")
+
+    list_pending = [(v, func) for v, func in MIGRATIONS if v > version]
+    if list_pending:
+        conn.execute("BEGIN; ")
+        try:
+            for _, func in list_pending:
+                func(conn)
+            conn.execute("DELETE FROM schema_version; ")
+            conn.execute("INSERT INTO schema_version VALUES (?); ", (version_latest,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if version:
+            print(f">> 数据库结构已升级: v{version} -> v{version_latest}")
+
+    for table, column, source_column, func in BACKFILLS:
+        num_rows = backfill(conn, table, column, source_column, func)
+        if num_rows:
+            print(f">> 已回填{table}.{column}: {num_rows}行")
+
+
+class ConnectionManager:
+    """ sqlite连接管理:
+        - 写操作由唯一的writer线程（独占写连接）按提交顺序执行
+        - 读操作使用各线程独立的只读连接，WAL模式下不被写操作阻塞
+        - 内存数据库（":memory:"）无法跨连接共享，全部操作均由writer执行
+    """
+    def __init__(self, path_db, pragmas=None):
+        self.path_db = path_db
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.is_memory = path_db == ":memory:" or path_db.startswith("file::memory:")
+        self._local = threading.local()
+        self._readers = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run_writer, daemon=True,
+                                        name="ArticlesDB-writer")
+        self._writer.start()
+
+    def _connect(self, **kwargs):
+        conn = sqlite3.connect(self.path_db, **kwargs)  # 若不存在，则创建新数据库
+        for key, value in self.pragmas.items():
+            if key == "journal_mode" and self.is_memory:
+                continue
+            conn.execute(f"PRAGMA {key} = {value}; ")
+        return conn
+
+    def _run_writer(self):
+        conn = self._connect()
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            func, args, future = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(conn, *args))
+            except BaseException as e:
+                future.set_exception(e)
+        conn.close()
+
+    def submit(self, func, *args):
+        """ 在writer线程中执行func(conn, *args)，阻塞至返回 """
+        if threading.current_thread() is self._writer:
+            raise RuntimeError("writer线程内不可嵌套提交")
+        future = Future()
+        self._queue.put((func, args, future))
+        return future.result()
+
+    def reader(self):
+        """ 当前线程的只读连接 """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.execute("PRAGMA query_only = 1; ")
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._lock:
+            for conn in self._readers:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:  # 由其他线程创建
+                    pass
+            self._readers.clear()
+
 
 class ArticlesDB:
+    """ 线程安全: 写操作经ConnectionManager的writer顺序执行，读操作可在各线程并发 """
     tb_name = "essay"  # "articles"
+    tb_catalog = "catalog"  # 仓库内全部笔记（无论是否已发布）
+    tb_stamp = "image_stamp"  # 上次发布时各图像的 (size, mtime_ns, url)
+    tb_fts = "essay_fts"  # 全文索引（FTS5），rowid与essay一致
+    tb_grams = "essay_grams"  # 短词的二元组索引，rowid与essay一致
+    columns = ("filepath", "postid", "title", "mdate", "tags", "weight", "digest")
+    cache_size = 256
 
-    def __init__(self, path_db):
-        self.db_connect(path_db)
+    def __init__(self, path_db, pragmas=None):
+        self._depth = 0  # transaction()的嵌套层数，仅在writer线程中修改
+        self._batch = 0  # batch()的嵌套层数，仅在writer线程中修改
+        self._local = threading.local()  # 当前线程所开启的transaction()层数
+        self._scope_lock = threading.RLock()  # transaction()期间由开启的线程持有，其他线程的写操作等待
+        self._cache = OrderedDict()  # (key_type, value): item，get_item()的查询结果
+        self._cache_lock = threading.Lock()
+        self._generation = 0  # 每次写入后递增，避免缓存写入前发起的查询结果
+        self.db_connect(path_db, pragmas)
         self.create_table()
+        list_rows = self.query("SELECT sql FROM sqlite_master WHERE name = ?; ", (self.tb_fts,))
+        self.has_fts = bool(list_rows)
+        self._fts_trigram = self.has_fts and "trigram" in list_rows[0][0]
+        self.has_grams = bool(self.query("SELECT 1 FROM sqlite_master WHERE name = ?; ",
+                                         (self.tb_grams,)))
 
     def __del__(self):
-        self.cursor.close()
-        self.conn.close()
+        self.close()
+
+    def close(self):
+        conns = self.__dict__.pop("conns", None)
+        if conns:
+            conns.close()
+
+    def checkpoint(self):
+        """ 将WAL中已提交的写入合并至数据库文件，并清空WAL：
+            数据库文件随仓库提交（git add）之前须调用，否则提交的文件可能缺少最近的写入
+        """
+        if self.conns.is_memory:
+            return
+        busy, *_ = self.conns.submit(
+            lambda conn: conn.execute("PRAGMA wal_checkpoint(TRUNCATE); ").fetchone())
+        if busy:
+            raise RuntimeError("数据库正被其他连接使用，未能完成checkpoint")
+
+    def db_connect(self, path_db=":memory:", pragmas=None):
+        self.conns = ConnectionManager(path_db, pragmas)
+
+    def _invalidate(self):
+        with self._cache_lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def _write(self, conn, SQL, args, many):
+        try:
+            cursor = conn.executemany(SQL, args) if many else conn.execute(SQL, args)
+            if not self._depth and not self._batch:  # 范围外立即提交，范围内推迟至范围退出时
+                conn.commit()
+        finally:
+            self._invalidate()
+        return cursor.rowcount
+
+    def execute(self, SQL, args=()):
+        """ 参数化写语句（sqlite3按SQL文本缓存预编译语句），return rowcount """
+        with self._scope_lock:
+            return self.conns.submit(self._write, SQL, args, False)
+
+    def executemany(self, SQL, list_args):
+        with self._scope_lock:
+            return self.conns.submit(self._write, SQL, list(list_args), True)
 
-    def execute_scripts(self, SQL):
-        print(f"SQL:\n\t{SQL}")
-        self.cursor.execute(SQL)
-        self.conn.commit()
+    def query(self, SQL, args=()):
+        """ 读语句，return fetchall()
+            当前线程处于transaction()范围内时经由writer读取，以看到本线程尚未提交的写入；
+            其余线程仍由各自的只读连接读取已提交的数据，不因他人的事务而排队
+        """
+        if getattr(self._local, "depth", 0) or self.conns.is_memory:
+            return self.conns.submit(lambda conn: conn.execute(SQL, args).fetchall())
+        return self.conns.reader().execute(SQL, args).fetchall()
 
-    def db_connect(self, path_db=":memory"):
-        self.conn = sqlite3.connect(path_db)  # 若不存在，则创建新数据库
-        self.cursor = self.conn.cursor()  # database cursor
+    def _begin(self, conn):
+        if not self._depth:
+            if self._batch and not conn.in_transaction:
+                conn.execute("BEGIN; ")  # 否则RELEASE会提交batch()中尚未提交的部分
+            conn.execute("SAVEPOINT scope; ")
+        self._depth += 1
+
+    def _end(self, conn, rollback):
+        self._depth -= 1
+        if not self._depth:
+            if rollback:
+                conn.execute("ROLLBACK TO scope; ")
+            conn.execute("RELEASE scope; ")  # batch()之外为最外层的SAVEPOINT，RELEASE即提交
+            # 只读连接在提交前可能缓存了旧数据
+            self._invalidate()
+
+    @contextmanager
+    def transaction(self, rollback=True):
+        """ 显式事务范围: 其中的全部写操作在退出时一次提交；可嵌套，以最外层为准
+            rollback: 出错时是否回滚；为False时保留已完成的写入
+            范围属于开启它的线程: 其间其他线程的写操作排队至范围结束，不会计入本事务，
+            因此回滚只撤销本线程的写入
+        """
+        with self._scope_lock:
+            self.conns.submit(self._begin)
+            self._local.depth = getattr(self._local, "depth", 0) + 1
+            try:
+                yield self
+            except BaseException:
+                self.conns.submit(self._end, rollback)
+                raise
+            else:
+                self.conns.submit(self._end, False)
+            finally:
+                self._local.depth -= 1
+
+    def _begin_batch(self, conn):
+        self._batch += 1
+
+    def _end_batch(self, conn):
+        self._batch -= 1
+        if not self._batch:
+            conn.commit()
+            self._invalidate()
+
+    @contextmanager
+    def batch(self):
+        """ 批量提交（如整个推送）: 范围内各线程的写入推迟至退出时一次提交；
+            不回滚: 出错时同样提交已完成的写入（对应的文章已发布）。
+            其中的transaction()仍属于各自的线程，回滚只撤销该范围内的写入；
+            读操作仍由只读连接执行，看不到范围内尚未提交的写入
+        """
+        self.conns.submit(self._begin_batch)
+        try:
+            yield self
+        finally:
+            self.conns.submit(self._end_batch)
 
     def drop_table(self):
-        self.cursor.execute(f"DROP TABLE IF EXISTS {self.tb_name}; ")
+        self.execute(f"DROP TABLE IF EXISTS {self.tb_name}; ")
 
     def create_table(self):
-        SQL = """
-        CREATE TABLE IF NOT EXISTS {} (
-            filepath CHAR(200) NOT NULL PRIMARY KEY
-            , postid CHAR(24) NOT NULL
-            , title CHAR(100) NOT NULL
-            , mdate CHAR(11)
-            , tags TEXT
-            , weight INTEGER default 5
-            , UNIQUE (postid)
-        ); """.format(self.tb_name)
-        self.cursor.executescript(SQL)
+        """ 建表及升级旧版数据库，见MIGRATIONS """
+        self.conns.submit(migrate)
 
     def del_item(self, path=None, postid=None):
-        if path:
-            SQL = f"DELETE FROM {self.tb_name} WHERE filepath='{path}'; "
-        elif postid:
-            SQL = f"DELETE FROM {self.tb_name} WHERE postid='{postid}'; "
-        self.execute_scripts(SQL)
+        with self.transaction():
+            if path:
+                key, value = "filepath", path
+                self.execute(f"DELETE FROM {self.tb_stamp} WHERE filepath = ?; ", (path,))
+            elif postid:
+                key, value = "postid", str(postid)
+                self.execute(f"DELETE FROM {self.tb_stamp} WHERE filepath IN "
+                             f"(SELECT filepath FROM {self.tb_name} WHERE postid = ?); ", (value,))
+            else:
+                return
+            self._unindex(key, value)
+            self.execute(f"DELETE FROM {self.tb_name} WHERE {key} = ?; ", (value,))
 
-    def insert_item(self, path_file, postid, title, mdate, tags: list, weight=5):
+    @staticmethod
+    def _item_args(path_file, postid, title, mdate, tags: list, weight=5, digest=None):
         if weight is None:
             weight = 5
-        SQL = f"INSERT INTO {self.tb_name} VALUES ('{path_file}', '{postid}', '{title}', '{mdate}', \"{tags}\", {weight}); "
-        self.execute_scripts(SQL)
+        return (path_file, str(postid), title, mdate, str(tags), weight, digest,
+                normalize_title(title))
+
+    def insert_item(self, path_file, postid, title, mdate, tags: list, weight=5, digest=None):
+        self.insert_items([(path_file, postid, title, mdate, tags, weight, digest)])
 
-    def update_item(self, path_file, postid, title, mdate, tags: list, weight=5):
-        # SQL = f"UPDATE {} SET {}='{}' WHERE md5='{}'; "
-        self.del_item(path=path_file)
-        self.insert_item(path_file, postid, title, mdate, tags, weight)
+    def update_item(self, path_file, postid, title, mdate, tags: list, weight=5, digest=None):
+        self.upsert_items([(path_file, postid, title, mdate, tags, weight, digest)])
+
+    def insert_items(self, list_items):
+        """ 批量插入: [(path_file, postid, title, mdate, tags, weight, digest)] """
+        SQL = f"""INSERT INTO {self.tb_name} ({", ".join(self.columns)}, title_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?); """
+        self.executemany(SQL, [self._item_args(*item) for item in list_items])
+
+    def upsert_items(self, list_items):
+        """ 批量插入或更新（按filepath），参数同insert_items() """
+        SQL = f"""INSERT INTO {self.tb_name} ({", ".join(self.columns)}, title_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (filepath) DO UPDATE SET
+                postid = excluded.postid, title = excluded.title, mdate = excluded.mdate,
+                tags = excluded.tags, weight = excluded.weight, digest = excluded.digest,
+                title_norm = excluded.title_norm; """
+        self.executemany(SQL, [self._item_args(*item) for item in list_items])
 
     def select(self):
-        SQL = f"SELECT * FROM {self.tb_name}; "
-        tuple_item = self.cursor.execute(SQL).fetchall()
-        return tuple_item
+        SQL = f"SELECT {', '.join(self.columns)} FROM {self.tb_name}; "
+        return self.query(SQL)
+
+    def get_item(self, path=None, postid=None, title=None):
+        """ 按filepath、postid或标题（规范化后比较，同名时取最早发布的一篇）查询，
+            return {column: value} or None；结果经由进程内缓存，任何写操作后失效
+        """
+        if path:
+            key = ("filepath", path)
+        elif postid:
+            key = ("postid", str(postid))
+        elif title:
+            key = ("title_norm", normalize_title(title))
+        else:
+            return None
+
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                item = self._cache[key]
+                return dict(item) if item else None
+            generation = self._generation
+
+        SQL = f"SELECT {', '.join(self.columns)} FROM {self.tb_name} " \
+              f"WHERE {key[0]} = ? ORDER BY rowid LIMIT 1; "
+        list_rows = self.query(SQL, (key[1],))
+        item = dict(zip(self.columns, list_rows[0])) if list_rows else None
+        with self._cache_lock:
+            if generation == self._generation:
+                self._cache[key] = item
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return dict(item) if item else None
 
-    def get_postid(self, path):
-        SQL = f"select postid from {self.tb_name} where filepath == '{path}'; "
-        tuple_item = self.cursor.execute(SQL).fetchall()
-        if tuple_item:
-            return tuple_item[0][0]
+    def get_postid(self, path=None, title=None):
+        item = self.get_item(path=path, title=title)
+        if item:
+            return item["postid"]
+
+    def get_title_by_postid(self, postid):
+        item = self.get_item(postid=postid)
+        if item:
+            return item["title"]
+
+    def get_digest(self, path=None, postid=None):
+        """ 上次发布内容的hash """
+        item = self.get_item(path=path, postid=postid)
+        if item:
+            return item["digest"]
+
+    def get_digests(self):
+        """ return {postid: digest} """
+        SQL = f"SELECT postid, digest FROM {self.tb_name}; "
+        return dict(self.query(SQL))
 
     def update_filepath(self, path_from, path_to):
-        SQL = f"UPDATE {self.tb_name} SET filepath='{path_to}' WHERE filepath ='{path_from}'; "
-        self.execute_scripts(SQL)
+        with self.transaction():
+            for tb_name in (self.tb_name, self.tb_stamp):
+                self.execute(f"UPDATE {tb_name} SET filepath = ? WHERE filepath = ?; ",
+                             (path_to, path_from))
+
+    def get_image_stamps(self, path):
+        """ return {image: (size, mtime_ns, url)}，image为文档中的相对路径 """
+        SQL = f"SELECT image, size, mtime_ns, url FROM {self.tb_stamp} WHERE filepath = ?; "
+        return {image: (size, mtime_ns, url) for image, size, mtime_ns, url in self.query(SQL, (path,))}
+
+    def set_image_stamps(self, path, dict_stamps):
+        """ 整体替换一篇文档的图像记录 """
+        with self.transaction():
+            self.execute(f"DELETE FROM {self.tb_stamp} WHERE filepath = ?; ", (path,))
+            self.executemany(f"INSERT INTO {self.tb_stamp} VALUES (?, ?, ?, ?, ?); ",
+                             [(path, image, *stamp) for image, stamp in dict_stamps.items()])
+
+    def index_post(self, path, title, tags: list, body):
+        """ 更新一篇已发布文章的全文索引（须先写入essay表） """
+        if not self.has_fts:
+            return
+        str_tags = " ".join(tags or [])
+        with self.transaction():
+            self._unindex("filepath", path)
+            self.execute(f"INSERT INTO {self.tb_fts} (rowid, title, tags, body) "
+                         f"SELECT rowid, ?, ?, ? FROM {self.tb_name} WHERE filepath = ?; ",
+                         (title, str_tags, body, path))
+            if self.has_grams:
+                self.execute(f"INSERT INTO {self.tb_grams} (rowid, title, tags, body) "
+                             f"SELECT rowid, ?, ?, ? FROM {self.tb_name} WHERE filepath = ?; ",
+                             (short_grams(title), short_grams(str_tags), short_grams(body), path))
+
+    def _unindex(self, key, value):
+        """ 删除essay中 key = value 的文章的全文索引（须在transaction()内调用）
+            contentless的二元组表只能以插入时的内容删除，由essay_fts中的原文重新生成
+        """
+        if not self.has_fts:
+            return
+        if self.has_grams:
+            SQL = f"""SELECT f.rowid, f.title, f.tags, f.body FROM {self.tb_fts} AS f
+                JOIN {self.tb_name} AS e ON e.rowid = f.rowid WHERE e.{key} = ?; """
+            self.executemany(f"INSERT INTO {self.tb_grams} ({self.tb_grams}, rowid, title, tags, body) "
+                             f"VALUES ('delete', ?, ?, ?, ?); ",
+                             [(rowid, *map(short_grams, columns))
+                              for rowid, *columns in self.query(SQL, (value,))])
+        self.execute(f"DELETE FROM {self.tb_fts} WHERE rowid IN "
+                     f"(SELECT rowid FROM {self.tb_name} WHERE {key} = ?); ", (value,))
+
+    def search(self, query, limit=20):
+        """ 全文检索已发布的文章，按bm25排序（标题、标签的权重高于正文）
+            return [{filepath, postid, title, snippet}]
+            trigram分词无法匹配少于3个字符的词，此类词改查二元组索引；含符号的短词（如C#）仍逐篇子串过滤
+        """
+        if not self.has_fts:
+            raise RuntimeError("当前sqlite未支持FTS5，无法全文检索")
+        list_terms = query.split()
+        if not list_terms:
+            return []
+        min_len = 3 if self._fts_trigram else 1
+        list_match = [t for t in list_terms if len(t) >= min_len]
+        list_short = [t for t in list_terms if len(t) < min_len]
+        list_gram = [t.lower() for t in list_short
+                     if self.has_grams and _re_word_run.fullmatch(t.lower())]
+
+        list_where, list_args = [], []
+        if list_match:
+            list_where.append(f"{self.tb_fts} MATCH ?")
+            list_args.append(" ".join('"{}"'.format(t.replace('"', '""')) for t in list_match))
+        if list_gram:
+            # 双字词即一个二元组；单字可能在二元组之首或串尾，按前缀匹配
+            # 同时有MATCH时以一元+阻止rowid条件下推，否则FTS5会对每个rowid各执行一次MATCH
+            list_where.append(f"{'+' if list_match else ''}{self.tb_fts}.rowid IN "
+                              f"(SELECT rowid FROM {self.tb_grams} WHERE {self.tb_grams} MATCH ?)")
+            list_args.append(" ".join(f'"{t}"' if len(t) > 1 else f'"{t}"*' for t in list_gram))
+        for term in list_short:
+            if term.lower() in list_gram:
+                continue
+            # 不区分大小写；无大小写之分的词（如中文）无需lower()整篇正文
+            func = "lower({})" if term.lower() != term.upper() else "{}"
+            list_where.append("(" + " OR ".join(
+                "instr({}, ?)".format(func.format(f"{self.tb_fts}.{column}"))
+                for column in ("title", "tags", "body")) + ")")
+            list_args.extend([term.lower()] * 3)
+        str_where = " AND ".join(list_where)
+
+        if list_match:
+            SQL = f"""SELECT e.filepath, e.postid, e.title, snippet({self.tb_fts}, -1, '**', '**', '...', 16)
+                FROM {self.tb_fts} JOIN {self.tb_name} AS e ON e.rowid = {self.tb_fts}.rowid
+                WHERE {str_where} ORDER BY bm25({self.tb_fts}, 10.0, 5.0, 1.0) LIMIT ?; """
+            list_args.append(limit)
+        else:
+            # 无法计算bm25，按发布顺序倒序；先取出limit篇，再截取其正文片段
+            SQL = f"""SELECT e.filepath, e.postid, e.title,
+                    substr({self.tb_fts}.body, max(instr({self.tb_fts}.body, ?) - 24, 1), 64)
+                FROM {self.tb_fts} JOIN {self.tb_name} AS e ON e.rowid = {self.tb_fts}.rowid
+                WHERE {self.tb_fts}.rowid IN (SELECT rowid FROM {self.tb_fts} WHERE {str_where}
+                    ORDER BY rowid DESC LIMIT ?)
+                ORDER BY e.rowid DESC; """
+            list_args = [list_short[0]] + list_args + [limit]
+        list_rows = self.query(SQL, list_args)
+        return [dict(zip(("filepath", "postid", "title", "snippet"), row)) for row in list_rows]
+
+    def get_catalog_stamps(self):
+        """ return {filepath: (size, mtime_ns, digest)} """
+        SQL = f"SELECT filepath, size, mtime_ns, digest FROM {self.tb_catalog}; "
+        return {i[0]: i[1:] for i in self.query(SQL)}
+
+    def upsert_catalog(self, list_items):
+        """ list_items: [{filepath, title, tags, categories, weight, images, size, mtime_ns, digest}] """
+        SQL = f"INSERT OR REPLACE INTO {self.tb_catalog} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?); "
+        self.executemany(SQL, [(
+                item["filepath"], item["title"],
+                json.dumps(item["tags"], ensure_ascii=False),
+                json.dumps(item["categories"], ensure_ascii=False),
+                item["weight"],
+                json.dumps(item["images"], ensure_ascii=False),
+                item["size"], item["mtime_ns"], item["digest"]
+            ) for item in list_items])
+
+    def update_catalog_stamps(self, list_stamps):
+        """ 内容未变化（仅touch）的文件，只更新文件时间: [(filepath, size, mtime_ns)] """
+        SQL = f"UPDATE {self.tb_catalog} SET size = ?, mtime_ns = ? WHERE filepath = ?; "
+        self.executemany(SQL, [(size, mtime_ns, path) for path, size, mtime_ns in list_stamps])
+
+    def del_catalog(self, list_paths):
+        SQL = f"DELETE FROM {self.tb_catalog} WHERE filepath = ?; "
+        self.executemany(SQL, [(path,) for path in list_paths])
+
+
+class ImagesDB:
+    """ 图像上传缓存: 图像内容hash -> cnblog_url
+        上传线程并发访问，连接须加锁
+    """
+    tb_name = "images"
+
+    def __init__(self, path_db):
+        self.conn = sqlite3.connect(path_db, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.create_table()
+
+    def __del__(self):
+        self.conn.close()
+
+    def create_table(self):
+        SQL = """
+        CREATE TABLE IF NOT EXISTS {} (
+            digest CHAR(40) NOT NULL PRIMARY KEY
+            , url TEXT NOT NULL
+            , name TEXT
+            , size INTEGER
+        ); """.format(self.tb_name)
+        with self.lock:
+            self.conn.executescript(SQL)
+
+    def get_url(self, digest):
+        SQL = f"SELECT url FROM {self.tb_name} WHERE digest = ?; "
+        with self.lock:
+            item = self.conn.execute(SQL, (digest,)).fetchone()
+            if item:
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+
+    def set_url(self, digest, url, name=None, size=None):
+        SQL = f"INSERT OR REPLACE INTO {self.tb_name} VALUES (?, ?, ?, ?); "
+        with self.lock:
+            self.conn.execute(SQL, (digest, url, name, size))
+            self.conn.commit()
+
+    def invalidate(self, digest=None, url=None):
+        """ 删除指定缓存项（例如服务器端图像已失效），返回删除条数 """
+        if digest:
+            SQL, args = f"DELETE FROM {self.tb_name} WHERE digest = ?; ", (digest,)
+        elif url:
+            SQL, args = f"DELETE FROM {self.tb_name} WHERE url = ?; ", (url,)
+        else:
+            return 0
+        with self.lock:
+            count = self.conn.execute(SQL, args).rowcount
+            self.conn.commit()
+        return count
+
+    def clear(self):
+        with self.lock:
+            count = self.conn.execute(f"DELETE FROM {self.tb_name}; ").rowcount
+            self.conn.commit()
+        return count
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
 
 
 def yaml2db(path_yaml="database.yml", path_db="test.db"):
@@ -82,19 +728,21 @@ def yaml2db(path_yaml="database.yml", path_db="test.db"):
         # self.data = json.load(fp)
         data = yaml.unsafe_load(fp)
 
-    db = CnblogDB(path_db)
+    db = ArticlesDB(path_db)
+    list_items = []
 
     def get_items(dict_, prefix):
         for subdir, subdict in dict_.items():
             prefix_next = prefix + [subdir]
             if "title" in subdict:
                 path = "/".join(prefix_next)
-                db.insert_item(path, subdict.get("postid"), subdict.get("title"),
-                    subdict.get("date"), subdict.get("tags"), subdict.get("weight"))
+                list_items.append((path, subdict.get("postid"), subdict.get("title"),
+                    subdict.get("date"), subdict.get("tags"), subdict.get("weight")))
             else:
                 get_items(subdict, prefix_next)
 
     get_items(data["structure"]["programming"], [])
+    db.upsert_items(list_items)  # 单次提交
     print("Done")
 
 if __name__ == "__main__":
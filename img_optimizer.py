@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from util.digest import file_digest
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from utils.log import getLogger
+except ImportError:
+    from logging import getLogger
+logger = getLogger()
+
+
+# 各格式的默认压缩参数，可由配置项"image_optimize"覆盖
+DEFAULT_OPTIONS = {
+    "png": {"max_width": 1600, "colors": 0},  # colors>0时量化为调色板图像
+    "jpg": {"max_width": 1600, "quality": 85},
+    "webp": {"max_width": 1600, "quality": 80},
+}
+_FORMATS = {"png": "PNG", "jpg": "JPEG", "webp": "WEBP"}
+_ALIASES = {"jpeg": "jpg"}
+
+
+def _image_format(path_img):
+    ext = os.path.splitext(path_img)[1][1:].lower()
+    return _ALIASES.get(ext, ext)
+
+
+def _mp_context():
+    """ 调用者为多线程进程（推送工作线程、数据库writer等），fork可能死锁，
+        优先使用forkserver，不支持时使用spawn
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _optimize_one(path_src, path_dst, fmt, options):
+    """ 进程池任务: 缩放并重新压缩；结果更小时写入path_dst，返回是否写入 """
+    with Image.open(path_src) as img:
+        if getattr(img, "is_animated", False):
+            return False
+        max_width = options.get("max_width")
+        if max_width and img.width > max_width:
+            height = round(img.height * max_width / img.width)
+            img = img.resize((max_width, height), Image.LANCZOS)
+
+        dict_save = {"optimize": True}
+        if fmt == "png":
+            colors = options.get("colors")
+            if colors:
+                img = img.convert("RGBA").quantize(colors)
+        else:
+            dict_save["quality"] = options.get("quality", 85)
+            if fmt == "jpg" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+        path_tmp = path_dst + ".tmp"
+        os.makedirs(os.path.dirname(path_dst), exist_ok=True)
+        img.save(path_tmp, _FORMATS[fmt], **dict_save)
+
+    if os.path.getsize(path_tmp) < os.path.getsize(path_src):
+        os.replace(path_tmp, path_dst)
+        return True
+    os.remove(path_tmp)
+    return False
+
+
+class ImageOptimizer:
+    """ 上传前的图像压缩（需要Pillow）
+        优化结果按 源图像hash+压缩参数 缓存于dir_cache，重复发布时直接复用：
+            dir_cache/<key>/<原文件名>  压缩后的图像（保持原文件名，便于上传）
+            dir_cache/<key>.skip        压缩无收益，使用原图
+        进程池在首次需要压缩时创建，由全部文档（及推送的各工作线程）共用，close()时关闭
+    """
+    def __init__(self, dir_cache, dict_conf=None):
+        dict_conf = dict_conf or {}
+        self.dir_cache = dir_cache
+        self.num_workers = max(1, int(dict_conf.get("workers", os.cpu_count() or 1)))
+        self.options = {}
+        for fmt, options in DEFAULT_OPTIONS.items():
+            self.options[fmt] = {**options, **dict_conf.get(fmt, {})}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                                     mp_context=_mp_context())
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown()
+
+    def _cache_key(self, path_src, fmt):
+        str_options = json.dumps(self.options[fmt], sort_keys=True)
+        digest_options = hashlib.sha1(str_options.encode()).hexdigest()[:8]
+        return f"{file_digest(path_src)}-{digest_options}"
+
+    def optimize(self, list_paths):
+        """ return {path_src: path_upload}，path_upload为压缩后的图像或原图 """
+        dict_upload = {path: path for path in list_paths}
+        if not self.available():
+            logger.warning("未安装Pillow，跳过图像压缩")
+            return dict_upload
+
+        dict_todo = {}  # path_src: (fmt, path_dst, path_skip)
+        for path_src in set(list_paths):
+            fmt = _image_format(path_src)
+            if fmt not in self.options:
+                continue
+            key = self._cache_key(path_src, fmt)
+            path_dst = os.path.join(self.dir_cache, key, os.path.basename(path_src))
+            path_skip = os.path.join(self.dir_cache, key + ".skip")
+            if os.path.exists(path_dst):
+                dict_upload[path_src] = path_dst
+            elif not os.path.exists(path_skip):
+                dict_todo[path_src] = (fmt, path_dst, path_skip)
+
+        if dict_todo:
+            os.makedirs(self.dir_cache, exist_ok=True)
+            executor = self._get_executor()
+            futures = {path_src: executor.submit(_optimize_one, path_src, path_dst,
+                                                 fmt, self.options[fmt])
+                       for path_src, (fmt, path_dst, _) in dict_todo.items()}
+            for path_src, future in futures.items():
+                _, path_dst, path_skip = dict_todo[path_src]
+                try:
+                    is_smaller = future.result()
+                except Exception as e:
+                    logger.warning(f"图像压缩失败，使用原图【{path_src}】: {e}")
+                    continue
+                if is_smaller:
+                    dict_upload[path_src] = path_dst
+                    print(f">> 已压缩图像:【{os.path.basename(path_src)}】"
+                          f"{os.path.getsize(path_src) // 1024}KB -> {os.path.getsize(path_dst) // 1024}KB")
+                else:
+                    open(path_skip, "w").close()
+        return dict_upload
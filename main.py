@@ -10,6 +10,7 @@ import os.path
 import shutil
 
 from util.gitsh import GitRepo
+from scheduler import AsyncPushEngine
 
 def getopt():
     import argparse
@@ -17,7 +18,18 @@ def getopt():
     parser = argparse.ArgumentParser("upload_cnblog", description="")
     parser.add_argument("-c", "--commit", action="store_true", help="提交文章")
     parser.add_argument("-p", "--push", action="store_true", help="推送至CnBlog博客园")
+    parser.add_argument("-f", "--force", action="store_true", help="推送时忽略内容hash，强制重新发布")
+    parser.add_argument("-b", "--backup", action="store_true",
+                        help="增量备份博客园blog至cnblog_bak: 本地发布的blog依发布hash判定是否变化；"
+                             "其余blog仅检查最近N篇（见--backup-recent），更早的blog在博客园上的修改无法发现")
+    parser.add_argument("--backup-recent", metavar="N", type=int, default=20,
+                        help="备份时检查的近期blog数量（MetaWeblog无分页接口，列表包含正文，N过大时响应很大）")
+    parser.add_argument("--catalog", action="store_true", help="索引仓库内全部笔记至数据库")
+    parser.add_argument("-s", "--search", metavar="QUERY", help="全文检索已发布的文章")
+    parser.add_argument("--reindex", action="store_true", help="重建已发布文章的全文索引")
     parser.add_argument("-d", "--html2md", action="store_true", help="爬取html为markdown")
+    parser.add_argument("--invalidate-img", metavar="URL", nargs="?", const="all",
+                        help="清除图像上传缓存（指定url，或缺省清除全部）")
     return parser.parse_args()
 
 class NoteRepoMgr:
@@ -45,24 +57,32 @@ class NoteRepoMgr:
         commit_message = input("Input commit message [回车默认提交]: ")
         self.git.commit(commit_message)
 
-    def push(self):
+    def push(self, force=False):
         commit_message = input("请确认当前仓库已经pull至最新版本 [Y/n]: ")
         if commit_message != "Y":
             return
         update_files = self.load_cache()
         # 读取
-        mod_, del_, new_, mov_ = [set(i) for i in update_files]
+        mod_, del_, new_, mov_ = [set(tuple(i) if isinstance(i, list) else i
+                                      for i in list_) for list_ in update_files]
+        # 并发推送；newPost受频率限制，其余操作在等待期间执行
+        engine = AsyncPushEngine(self.cnblog_mgr)
         for p in mod_ | new_:
-            self.cnblog_mgr.post_blog(p)
+            engine.add_post(p, force=force)
         for p in del_:
-            self.cnblog_mgr.delete_blog(p)
+            engine.add_delete(p)
         for pfrom, pto in mov_:
-            self.cnblog_mgr.move_blog(pfrom, pto)
+            engine.add_move(pfrom, pto, force=force)
+        engine.run()
+        stats = self.cnblog_mgr.doc_cache.stats()
+        print(f">> 文档解析缓存: 命中{stats['hits']}次，未命中{stats['misses']}次"
+              f"（{stats['entries']}篇，{stats['bytes'] // 1024}KB）")
 
         with open(self.path_cache, "w") as fp:
             json.dump([[]]*4, fp, ensure_ascii=False, indent=2)
         # 添加git add .cnblog.db
-
+        # WAL模式下已提交的写入可能仍在.blogs.db-wal中，合并至数据库文件后再提交
+        self.cnblog_mgr.db.checkpoint()
         self.git.add([self.path_cache, self.path_db])
         commit_message = "上传cnblogs"
         self.git.commit(commit_message)
@@ -167,7 +187,20 @@ if __name__ == "__main__":
     if args.commit:
         mgr.commit_repo()
     elif args.push:
-        mgr.push()
+        mgr.push(force=args.force)
+    elif args.catalog:
+        from catalog import CatalogBuilder
+        CatalogBuilder(cnblog).build()
+    elif args.backup:
+        cnblog.backup_blog(num_recent=args.backup_recent, force=args.force)
+    elif args.reindex:
+        cnblog.reindex_blogs()
+    elif args.search:
+        list_results = cnblog.db.search(args.search)
+        for item in list_results:
+            snippet = " ".join(item["snippet"].split())
+            print(f"{item['filepath']}  【{item['postid']}】{item['title']}\n    {snippet}")
+        print(f">> 共{len(list_results)}项结果")
     elif args.html2md:
         import urllib.request as urllib
         from util import html2md
@@ -177,4 +210,11 @@ if __name__ == "__main__":
         if not os.path.exists(tmp_dir):
             os.mkdir(tmp_dir)
         html2markdown(path, tmp_dir)
+    elif args.invalidate_img:
+        if args.invalidate_img == "all":
+            count = cnblog.img_cache.clear()
+        else:
+            count = cnblog.img_cache.invalidate(url=args.invalidate_img)
+        print(f">> 已清除图像缓存: {count}项")
+    cnblog.close()
 
@@ -6,6 +6,10 @@
 
 import os.path
 import re
+import copy
+import bisect
+import threading
+from collections import OrderedDict
 
 
 class NullMarkdownFile(Exception):
@@ -14,6 +18,16 @@ class NullMarkdownFile(Exception):
 class TextLocked(Exception):
     """ 文本内容已加锁，当前不可修改 """
 
+class MetaSyntaxError(Exception):
+    """ 元数据格式错误，lineno/col从1开始计数 """
+    def __init__(self, msg, lineno=None, col=None, path_file=None):
+        self.msg = msg
+        self.lineno = lineno
+        self.col = col
+        self.path_file = path_file
+        position = ":".join(str(i) for i in (path_file, lineno, col) if i is not None)
+        super().__init__(f"{position}: {msg}" if position else msg)
+
 # class MetaDataMissing(Exception):
 #     """ 缺失元数据 """
 
@@ -21,6 +35,219 @@ class TextLocked(Exception):
 #     """ 缺失[TOC]标识 """
 
 
+class TextBuffer:
+    """ 按行存储的可编辑文本
+        - 行替换O(1)
+        - render()的拼接结果缓存至下一次修改
+        开销: insert/pop为list的O(n)平移（C层memmove，20万行约60us）；图像改写只使用replace，不受影响。
+        有意保留list而非分块结构: 遍历、拼接及流式发送均直接使用lines
+    """
+    def __init__(self, list_lines=None):
+        self.lines = list(list_lines or [])
+        self._rendered = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        return self.lines[index]
+
+    def _normalize(self, index, size):
+        if index < 0:
+            index += size
+        return max(0, min(size, index))
+
+    def replace(self, index, line):
+        self.lines[index] = line
+        self._rendered = None
+
+    def insert(self, index, line):
+        """ return: 实际插入的行号 """
+        index = self._normalize(index, len(self.lines))
+        self.lines.insert(index, line)
+        self._rendered = None
+        return index
+
+    def pop(self, index):
+        """ return: (实际删除的行号, 删除的行) """
+        if index < 0:
+            index += len(self.lines)
+        line = self.lines.pop(index)
+        self._rendered = None
+        return index, line
+
+    def render(self):
+        if self._rendered is None:
+            self._rendered = "".join(self.lines)
+        return self._rendered
+
+
+class _MetaValueParser:
+    """ 元数据值的解析: 字符串、数字、布尔值、日期（保留为字符串）及列表 """
+    _re_number = re.compile(r"[+-]?(\d[\d_]*)(\.\d[\d_]*)?([eE][+-]?\d+)?")
+    _re_date = re.compile(r"\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?"
+                          r"(Z|[+-]\d{2}:\d{2})?")
+    _re_word = re.compile(r"[A-Za-z_]\w*")
+    _words = {"true": True, "false": False, "True": True, "False": False,
+              "None": None, "null": None}
+    _escapes = {"n": "\n", "t": "\t", "r": "\r", "0": "\0", "\\": "\\",
+                "'": "'", '"': '"', "\n": ""}
+
+    def __init__(self, text, lineno=None, col_offset=0):
+        self.text = text
+        self.pos = 0
+        self.lineno = lineno
+        self.col_offset = col_offset
+
+    def error(self, msg):
+        raise MetaSyntaxError(msg, self.lineno, self.col_offset + self.pos + 1)
+
+    def skip_space(self):
+        while self.pos < len(self.text) and self.text[self.pos] in " \t\r\n":
+            self.pos += 1
+
+    def parse(self):
+        self.skip_space()
+        value = self.parse_value()
+        self.skip_space()
+        if self.pos < len(self.text) and self.text[self.pos] != "#":  # 允许行尾注释
+            self.error(f"多余的字符: {self.text[self.pos:]!r}")
+        return value
+
+    def parse_value(self):
+        if self.pos >= len(self.text):
+            self.error("缺少值")
+        char = self.text[self.pos]
+        if char in "\"'":
+            return self.parse_string(char)
+        if char == "[":
+            return self.parse_list()
+
+        re_match = self._re_date.match(self.text, self.pos)
+        if re_match:
+            self.pos = re_match.end()
+            return re_match.group()
+        re_match = self._re_number.match(self.text, self.pos)
+        if re_match:
+            self.pos = re_match.end()
+            str_num = re_match.group().replace("_", "")
+            if re_match.group(2) or re_match.group(3):
+                return float(str_num)
+            return int(str_num)
+        re_match = self._re_word.match(self.text, self.pos)
+        if re_match and re_match.group() in self._words:
+            self.pos = re_match.end()
+            return self._words[re_match.group()]
+        self.error(f"无法识别的值: {self.text[self.pos:]!r}")
+
+    def parse_string(self, quote):
+        self.pos += 1
+        end = self.text.find(quote, self.pos)
+        if end >= 0 and self.text.find("\\", self.pos, end) < 0:  # 无转义字符
+            value = self.text[self.pos: end]
+            self.pos = end + 1
+            return value
+
+        list_chars = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char == quote:
+                self.pos += 1
+                return "".join(list_chars)
+            if char == "\\":
+                self.pos += 1
+                if self.pos >= len(self.text):
+                    break
+                escape = self.text[self.pos]
+                if escape == "u":
+                    code = self.text[self.pos+1: self.pos+5]
+                    if len(code) != 4 or not all(c in "0123456789abcdefABCDEF" for c in code):
+                        self.error("无效的\\u转义")
+                    list_chars.append(chr(int(code, 16)))
+                    self.pos += 5
+                    continue
+                list_chars.append(self._escapes.get(escape, "\\" + escape))
+            else:
+                list_chars.append(char)
+            self.pos += 1
+        self.error("字符串缺少结束引号")
+
+    def parse_list(self):
+        self.pos += 1
+        list_values = []
+        while True:
+            self.skip_space()
+            if self.pos >= len(self.text):
+                self.error("列表缺少']'")
+            if self.text[self.pos] == "]":
+                self.pos += 1
+                return list_values
+            list_values.append(self.parse_value())
+            self.skip_space()
+            if self.pos < len(self.text) and self.text[self.pos] == ",":
+                self.pos += 1
+            elif self.pos >= len(self.text) or self.text[self.pos] != "]":
+                self.error("列表元素之间缺少','")
+
+
+def parse_meta_value(text, lineno=None, col_offset=0):
+    """ 解析元数据的值（替代eval），格式错误时抛出MetaSyntaxError """
+    return _MetaValueParser(text, lineno, col_offset).parse()
+
+
+def parse_meta_line(line, lineno=None):
+    """ 'key = value' -> (key, value)，仅以第一个'='分隔 """
+    key, sep, value = line.partition("=")
+    key = key.strip()
+    if not sep or not key:
+        raise MetaSyntaxError("应为'key = value'格式", lineno, 1)
+    return key, parse_meta_value(value, lineno, len(line) - len(value))
+
+
+class DocumentCache:
+    """ 已解析文档的LRU缓存，以 (path, mtime_ns, size) 判定是否有效
+        max_bytes: 缓存文本的内存预算（估算值）
+    """
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # path: (key, state, nbytes)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(stat):
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path_file, stat):
+        with self._lock:
+            item = self._items.get(path_file)
+            if item and item[0] == self._key(stat):
+                self._items.move_to_end(path_file)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+
+    def put(self, path_file, stat, state):
+        nbytes = sum(map(len, state["lines"])) + 64 * len(state["lines"])
+        with self._lock:
+            item = self._items.pop(path_file, None)
+            if item:
+                self.nbytes -= item[2]
+            if nbytes > self.max_bytes:
+                return
+            self._items[path_file] = (self._key(stat), state, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, item = self._items.popitem(last=False)
+                self.nbytes -= item[2]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self._items), "bytes": self.nbytes}
+
+
 class MarkdownParser:
     """ 支持以下两种格式：
         1. 含H1格式的原生md文件（mkdocs）
@@ -33,14 +260,18 @@ class MarkdownParser:
         "http": re.compile(r"!\[.*\]\((http.*?)\)"),
         "backup": re.compile(r"!\[.*\]\(.*\)\s*<!-- (.*) -->")
     }
+    pattern_list_item = re.compile(r"\s{0,3}([-*+]|\d+[.)])(\s|$)")
 
-    def __init__(self):
+    def __init__(self, cache=None):
+        """ cache: DocumentCache，可由多个MarkdownParser共享 """
         self.ignore_websites = []
+        self.cache = cache
 
     def _clear_metadata(self):
         self.file_path = ""
-        self.__text_lines = []
+        self.__buffer = TextBuffer()
         self.__text_lock = False
+        self._clear_index()
         self.metadata = {
             "title": "",
             "description": "",
@@ -66,10 +297,16 @@ class MarkdownParser:
         return self.metadata["weight"]
 
     def get_text(self):
-        return self.__text_lines
+        """ 当前文本的行列表（只读，修改请使用modify_text等接口） """
+        return self.__buffer.lines
 
     def set_text(self, list_lines):
-        self.__text_lines = list_lines
+        self.__buffer = TextBuffer(list_lines)
+        self._index_dirty = True
+
+    def render(self):
+        """ 完整文本，缓存至下一次修改 """
+        return self.__buffer.render()
 
     def _set_line(self, content):
         if not content.endswith("\n"):
@@ -78,19 +315,87 @@ class MarkdownParser:
 
     def modify_text(self, index, content):
         self.check_lock()
-        self.__text_lines[index] = self._set_line(content)
+        line_old = self.__buffer[index]
+        self.__buffer.replace(index, self._set_line(content))
+        self._reindex_line(index, line_old)
 
     def insert_text(self, index, content):
         self.check_lock()
-        self.__text_lines.insert(index, self._set_line(content))
+        index = self.__buffer.insert(index, self._set_line(content))
+        self._shift_index(index, 1, "")
 
     def append_text(self, content):
         self.check_lock()
-        self.__text_lines.append(self._set_line(content))
+        self.insert_text(len(self.__buffer), content)
 
     def pop_text(self, index):
         self.check_lock()
-        self.__text_lines.pop(index)
+        index, line_old = self.__buffer.pop(index)
+        self._shift_index(index, -1, line_old)
+
+    @staticmethod
+    def _is_fence(line):
+        return line.lstrip().startswith(("```", "~~~"))
+
+    def _line_shape(self, line):
+        """ 影响块结构的行特征: (空行, 缩进>=4, 列表项, 围栏, 注释开始) """
+        return (not line.strip(),
+                line.startswith(("    ", "\t")),
+                bool(self.pattern_list_item.match(line)),
+                self._is_fence(line),
+                line.lstrip().startswith("<!--"))
+
+    def _is_plain(self, line):
+        """ 普通段落行: 不会改变其前后行的块结构 """
+        return not any(self._line_shape(line)) and not line[0].isspace() and \
+            "-->" not in line
+
+    def _block_at(self, index):
+        """ return 该行所属的块类型（None/"fence"/"indent"/"comment"） """
+        pos = bisect.bisect_right(self.blocks, (index, float("inf"))) - 1
+        if pos >= 0 and self.blocks[pos][0] <= index <= self.blocks[pos][1]:
+            return self.blocks[pos][2]
+
+    def _shift_index(self, index, delta, line_old):
+        """ 插入/删除一行: 平移其后的索引项，无需重新扫描全文；
+            仅当该行及其后一行均为普通段落行（块结构不变）时适用，否则整体重建
+        """
+        if self._index_dirty:
+            return
+        line_changed = self.__buffer[index] if delta > 0 else line_old
+        index_next = index + 1 if delta > 0 else index
+        line_next = self.__buffer[index_next] if index_next < len(self.__buffer) else "."
+        if self._block_unclosed or self._block_at(index) or \
+                not self._is_plain(line_changed) or not self._is_plain(line_next):
+            self._index_dirty = True
+            return
+
+        def shift(i):
+            return i + delta if i >= index else i
+
+        image_lines = {}
+        for i, dict_match in self.image_lines.items():
+            if delta < 0 and i == index:
+                continue
+            image_lines[shift(i)] = dict_match
+        self.image_lines = image_lines
+        self.blocks = [(shift(begin), shift(end), kind) for begin, end, kind in self.blocks]
+        if delta > 0:
+            self._index_line(index, self.__buffer[index])
+
+    def _reindex_line(self, index, line_old):
+        """ 单行修改: 块结构不变时仅更新该行的图像索引，否则整体重建 """
+        if self._index_dirty:
+            return
+        line_new = self.__buffer[index]
+        kind = self._block_at(index)
+        if self._line_shape(line_old) != self._line_shape(line_new) or \
+                self._is_fence(line_new) or line_new.lstrip().startswith("<!--") or \
+                (kind == "comment" and ("-->" in line_old or "-->" in line_new)):
+            self._index_dirty = True
+            return
+        if kind is None:
+            self._index_line(index, line_new)
 
     def lock_text(self):
         self.__text_lock = True
@@ -105,43 +410,192 @@ class MarkdownParser:
     def load_file(self, path_file):
         self._clear_metadata()
         self.file_path = path_file
+        if self.cache is not None:
+            stat = os.stat(path_file)
+            state = self.cache.get(path_file, stat)
+            if state:
+                self._restore(state)
+                return
+
         with open(self.file_path, "r", encoding="utf8") as fp:
-            self.__text_lines = fp.readlines()
+            self.__buffer = TextBuffer(fp.readlines())
 
         if not self.get_text():
             raise NullMarkdownFile()
 
-        self._parse_metadata()
+        self._scan()
+        if self.cache is not None:
+            self.cache.put(path_file, stat, self._snapshot())
+
+    def _snapshot(self):
+        """ 解析结果（不可变副本），供DocumentCache存储 """
+        return {
+            "lines": tuple(self.__buffer.lines),
+            "metadata": copy.deepcopy(self.metadata),
+            "check_list": dict(self.check_list),
+            "meta_range": list(self.meta_range),
+            "blocks": list(self.blocks),
+            "block_unclosed": self._block_unclosed,
+            "image_lines": {k: dict(v) for k, v in self.image_lines.items()},
+        }
 
-    def _parse_metadata(self):
+    def _restore(self, state):
+        self.__buffer = TextBuffer(state["lines"])
+        self.metadata = copy.deepcopy(state["metadata"])
+        self.check_list = dict(state["check_list"])
+        self.meta_range = list(state["meta_range"])
+        self.blocks = list(state["blocks"])
+        self._block_unclosed = state["block_unclosed"]
+        self.image_lines = {k: dict(v) for k, v in state["image_lines"].items()}
+
+    def _scan(self):
+        """ 单次遍历全文: 块结构、元数据（至首个H2为止）、H1/H2/TOC及块外的图像引用 """
         self.meta_range = [None, None]
+        self._edit_meta = False
+        self._clear_index()
 
-        edit_meta = False
+        in_header = True
         for index, line in enumerate(self.get_text()):
-            if edit_meta:
-                if line.startswith("+++ -->"):
-                    edit_meta = False
-                    self.meta_range[1] = index
-                else:
-                    key, value = line.split("=")
-                    self.metadata[key.strip()] = eval(value)
-                continue
+            kind = self._block_kind(index, line)
+            if in_header:
+                in_header = self._parse_header_line(index, line, kind)
+            if kind is None:
+                self._index_line(index, line)
+        self._close_index()
+
+    def _parse_metadata(self):
+        self._scan()
 
-            if line.startswith("+++"):
-                edit_meta = True
-                self.meta_range[0] = index -1
-                # self.check_list["has_metadata"] = True
-            elif line.startswith("## "):
-                self.check_list["index_H2"] = index
-                # H2_text = line[2:].lstrip()
-                # self.check_list["has_serial_num"] = H2_text.startswith("1. ")
-                break
-            elif line.startswith("# "):  # H1
-                if not self.metadata["title"]:
-                    self.metadata["title"] = line[2:].strip()
-                self.check_list["index_H1"] = index
-            elif line.startswith("[TOC]"):
-                self.check_list["find_TOC"] = True
+    def _parse_header_line(self, index, line, kind=None):
+        """ 解析文档头部的一行，遇到H2时返回False（头部结束）
+            kind: 该行所属的块类型；代码块内的行被忽略，注释内仅解析元数据
+        """
+        if self._edit_meta:
+            if line.startswith("+++ -->"):
+                self._edit_meta = False
+                self.meta_range[1] = index
+            else:
+                try:
+                    key, value = parse_meta_line(line, index +1)
+                except MetaSyntaxError as e:
+                    raise MetaSyntaxError(e.msg, e.lineno, e.col, self.file_path) from None
+                self.metadata[key] = value
+            return True
+
+        if kind in ("fence", "indent"):
+            return True
+        if line.startswith("+++"):
+            self._edit_meta = True
+            self.meta_range[0] = index -1
+            # self.check_list["has_metadata"] = True
+        elif kind == "comment":
+            return True
+        elif line.startswith("## "):
+            self.check_list["index_H2"] = index
+            # H2_text = line[2:].lstrip()
+            # self.check_list["has_serial_num"] = H2_text.startswith("1. ")
+            return False
+        elif line.startswith("# "):  # H1
+            if not self.metadata["title"]:
+                self.metadata["title"] = line[2:].strip()
+            self.check_list["index_H1"] = index
+        elif line.startswith("[TOC]"):
+            self.check_list["find_TOC"] = True
+        return True
+
+    def _clear_index(self):
+        self.blocks = []  # [(line_begin, line_end, kind)]，kind in ("fence", "indent", "comment")
+        self.image_lines = {}  # line_idx: {type_: url}，不含块内的行
+        self._block = None  # 当前未结束的块: (kind, line_begin, marker)，marker为开始围栏的整串字符
+        self._block_last = None  # 缩进代码块的最后一个非空行
+        self._prev_blank = True
+        self._in_list = False
+        self._block_unclosed = False  # 末尾的块未结束，其范围随文末变化
+        self._index_dirty = False
+
+    def _block_kind(self, index, line):
+        """ 块结构状态机（须按行序调用）: return 该行所属的块类型
+            fence:   ```或~~~围栏代码块（含围栏行）
+            indent:  空行之后缩进>=4的代码块（列表项内的缩进视为列表内容）
+            comment: 以"<!--"开头的多行HTML注释（行内的"<!-- -->"不计）
+        """
+        stripped = line.strip()
+        kind = None
+        if self._block is not None:
+            kind, begin, marker = self._block
+            if kind == "fence":
+                # 结束围栏: 仅由同一字符组成，且不短于开始围栏
+                if len(stripped) >= len(marker) and not stripped.strip(marker[0]):
+                    self.blocks.append((begin, index, kind))
+                    self._block = None
+            elif kind == "comment":
+                if "-->" in line:
+                    self.blocks.append((begin, index, kind))
+                    self._block = None
+            elif not stripped or line.startswith(("    ", "\t")):  # indent
+                if stripped:
+                    self._block_last = index
+            else:
+                self.blocks.append((begin, self._block_last, kind))
+                self._block = kind = None
+
+        if kind is None:
+            if stripped.startswith(("```", "~~~")):
+                kind = "fence"
+                marker = stripped[:len(stripped) - len(stripped.lstrip(stripped[0]))]
+                self._block = (kind, index, marker)
+            elif stripped.startswith("<!--") and "-->" not in stripped[4:]:
+                kind = "comment"
+                self._block = (kind, index, None)
+            elif stripped and line.startswith(("    ", "\t")) and \
+                    self._prev_blank and not self._in_list:
+                kind = "indent"
+                self._block = (kind, index, None)
+                self._block_last = index
+            elif self.pattern_list_item.match(line):
+                self._in_list = True
+            elif stripped and not line[0].isspace():
+                self._in_list = False
+        self._prev_blank = not stripped
+        return kind
+
+    def _index_line(self, index, line):
+        """ 更新一行（块外）的图像索引 """
+        if "![" in line:
+            dict_match = self._match_images(line)
+            if dict_match:
+                self.image_lines[index] = dict_match
+            else:
+                self.image_lines.pop(index, None)
+        else:
+            self.image_lines.pop(index, None)
+
+    def _close_index(self):
+        if self._block is not None:  # 未结束的块延续至文末
+            kind, begin, _ = self._block
+            end = self._block_last if kind == "indent" else len(self.get_text()) - 1
+            self.blocks.append((begin, end, kind))
+            self._block = None
+            self._block_unclosed = True
+
+    def _match_images(self, line):
+        """ return {type_: url}，各类型的正则均适用于一个group """
+        text = line.strip()
+        dict_match = {}
+        for type_, pattern in self.pattern_images.items():
+            re_match = pattern.match(text)
+            if re_match:
+                dict_match[type_] = re_match.group(1)
+        return dict_match
+
+    def _get_index(self):
+        if self._index_dirty:
+            self._clear_index()
+            for index, line in enumerate(self.get_text()):
+                if self._block_kind(index, line) is None:
+                    self._index_line(index, line)
+            self._close_index()
+        return self.image_lines
 
     def get_images(self, type_="all", force_abspath=True, ignore_websites=None):
         """ 临时有效，会加锁文本数据
@@ -160,19 +614,15 @@ class MarkdownParser:
         if type_ == "local":
             type_ = "all"
 
-        def match_regex(pattern, text):
-            """ 适用于一个group的正则式 """
-            re_match = re.match(pattern, text.strip())
-            return re_match.group(1) if re_match else None
-
         dict_images = {}  # line: url
-        for index, line in enumerate(self.get_text()):
-            url_img = match_regex(self.pattern_images[type_], line)
+        image_lines = self._get_index()
+        for index in sorted(image_lines):
+            url_img = image_lines[index].get(type_)
             if url_img:
                 if url_img.startswith("http"):
                     if is_type_local:
                         continue
-                    elif line.find("<!--"):
+                    elif self.get_text()[index].find("<!--"):
                         be_ignored = False
                         for http_prefix in ignore_websites + self.ignore_websites:
                             if url_img.find(http_prefix) >= 0:
@@ -188,12 +638,19 @@ class MarkdownParser:
     def process_images(self, dict_images, callback):
         """ callback(url) -> new_url
         """
-        self.unlock_text()
+        dict_urls = {}
         for line_idx, url_img in dict_images.items():
             url_new = callback(url_img)
             if url_new:
-                num_space = self.get_text()[line_idx].find("!")
-                self.modify_text(line_idx, " "*num_space + "![]({})" % url_new)
+                dict_urls[line_idx] = url_new
+        self.replace_images(dict_urls)
+
+    def replace_images(self, dict_urls):
+        """ dict_urls: {line_idx: url_new}，按行号改写图像链接 """
+        self.unlock_text()
+        for line_idx, url_new in dict_urls.items():
+            num_space = self.get_text()[line_idx].find("!")
+            self.modify_text(line_idx, " "*num_space + "![]({})".format(url_new))
 
     def make_title(self):
         blog_title = self.metadata["description"]  # 起一个吸引人的标题
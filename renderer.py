@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import threading
+from html.parser import HTMLParser
+
+from util.digest import text_digest
+
+try:
+    import markdown
+except ImportError:
+    markdown = None
+
+try:
+    from utils.log import getLogger
+except ImportError:
+    from logging import getLogger
+logger = getLogger()
+
+
+# 默认渲染参数，可由配置项"render_html"覆盖
+DEFAULT_OPTIONS = {
+    "extensions": ["extra", "sane_lists", "toc"],
+    "extension_configs": {"toc": {"marker": "[TOC]"}},
+}
+
+# cnblog接受的HTML标签，其余'<xxx>'将导致 <Fault 0
+HTML_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "caption", "center", "cite", "code", "col",
+    "colgroup", "dd", "del", "details", "div", "dl", "dt", "em", "figcaption", "figure",
+    "font", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "ins", "kbd", "li",
+    "mark", "ol", "p", "pre", "q", "s", "samp", "small", "span", "strike", "strong",
+    "sub", "summary", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u",
+    "ul", "var", "video", "audio", "source", "iframe", "svg", "path",
+}
+
+
+class RenderError(Exception):
+    """ 渲染结果包含cnblog无法接受的内容 """
+
+
+class _TagChecker(HTMLParser):
+    """ 收集HTML中的未知标签: [(lineno, tag)] """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.list_unknown = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in HTML_TAGS:
+            self.list_unknown.append((self.getpos()[0], tag))
+
+    handle_startendtag = handle_starttag
+
+
+def check_html(html):
+    """ 发布前校验HTML，存在未知标签时抛出RenderError """
+    checker = _TagChecker()
+    checker.feed(html)
+    checker.close()
+    if checker.list_unknown:
+        str_tags = ", ".join(f"<{tag}>(line {lineno})" for lineno, tag in checker.list_unknown[:10])
+        raise RenderError(f"文档中存在未转义的标签字符: {str_tags}")
+
+
+class HtmlRenderer:
+    """ 本地Markdown->HTML预渲染（需要Python-Markdown）
+        渲染结果按 源文本hash+渲染参数 缓存于dir_cache，未变化的文档不再渲染：
+            dir_cache/<key>.html
+    """
+    def __init__(self, dir_cache, dict_conf=None):
+        dict_conf = dict_conf or {}
+        self.dir_cache = dir_cache
+        self.options = {key: dict_conf.get(key, value) for key, value in DEFAULT_OPTIONS.items()}
+        self._digest_options = text_digest(json.dumps(self.options, sort_keys=True))
+
+    @staticmethod
+    def available():
+        return markdown is not None
+
+    def _convert(self, text):
+        return markdown.markdown(text, **self.options)
+
+    def render(self, text):
+        """ return 校验过的HTML """
+        if not self.available():
+            raise RenderError("未安装Markdown，无法使用本地渲染（pip install markdown）")
+
+        key = text_digest(text, self._digest_options)
+        path_cache = os.path.join(self.dir_cache, key + ".html")
+        if os.path.exists(path_cache):
+            with open(path_cache, "r", encoding="utf8") as fp:
+                return fp.read()
+
+        html = self._convert(text)
+        check_html(html)  # 校验失败的结果不写入缓存
+        os.makedirs(self.dir_cache, exist_ok=True)
+        path_tmp = f"{path_cache}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(path_tmp, "w", encoding="utf8") as fp:
+            fp.write(html)
+        os.replace(path_tmp, path_cache)
+        return html
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import monotonic
+
+from cnblog import FrequencyLimited
+
+
+NEWPOST_INTERVAL = 30  # cnblog限制: 30秒内只能发布1篇博文
+
+
+class TokenBucket:
+    """ 令牌桶: 每interval秒生成一个令牌，最多积攒capacity个 """
+    def __init__(self, interval, capacity=1):
+        self.interval = interval
+        self.capacity = capacity
+        self.tokens = capacity
+        self.time_last = monotonic()
+
+    def _refill(self):
+        now = monotonic()
+        if self.interval <= 0:
+            self.tokens = self.capacity
+        else:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.time_last) / self.interval)
+        self.time_last = now
+
+    def wait_time(self):
+        """ 距离下一个可用令牌的秒数，0表示当前可用 """
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * self.interval
+
+    def try_acquire(self):
+        if self.wait_time() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def drain(self):
+        """ 服务器仍拒绝请求时，清空令牌，重新计时 """
+        self.tokens = 0
+        self.time_last = monotonic()
+
+
+class PushFailed(Exception):
+    """ 推送过程中有操作失败（其余不相关的操作已完成） """
+
+
+class _Operation:
+    def __init__(self, name, func, args, kwargs, keys, path_post=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.keys = keys
+        self.path_post = path_post  # post操作: 发布前需判定是否为newPost
+        self.deps = []
+        self.error = None
+        self.done = asyncio.Event()
+
+
+class AsyncPushEngine:
+    """ 并发推送: 互不相关的操作在线程池中并发执行（数量由"push_workers"限制），
+        涉及同一path或postid的操作按 delete -> move -> post 的顺序串行；
+        newPost受令牌桶限制，等待期间其余操作照常执行；
+        数据库读写由ArticlesDB自身保证线程安全: 整个推送的写入在结束时一次提交（ArticlesDB.batch），
+        读操作由各线程的只读连接并发执行，不经由writer排队；
+        各操作不读取其他操作尚未提交的写入（各操作的path互不重叠，move显式传递postid）
+    """
+    def __init__(self, cnblog_mgr, concurrency=None, interval=None):
+        self.cnblog_mgr = cnblog_mgr
+        dict_conf = cnblog_mgr.dict_conf
+        if concurrency is None:
+            concurrency = dict_conf.get("push_workers", 4)
+        if interval is None:
+            interval = dict_conf.get("newpost_interval", NEWPOST_INTERVAL)
+        self.concurrency = max(1, int(concurrency))
+        self.bucket = TokenBucket(interval)
+        self.num_waiting = 0
+        self.list_delete = []
+        self.list_move = []
+        self.list_post = []
+
+    def add_post(self, path_md, **kwargs):
+        self.list_post.append((path_md, kwargs))
+
+    def add_delete(self, path_md):
+        self.list_delete.append(path_md)
+
+    def add_move(self, path_from, path_to, **kwargs):
+        self.list_move.append((path_from, path_to, kwargs))
+
+    def _build(self):
+        """ 依照 delete -> move -> post 的顺序，为共享path/postid的操作建立依赖 """
+        mgr = self.cnblog_mgr
+        db = mgr.db
+
+        def postid_key(path_md):
+            postid = db.get_postid(path_md)
+            return [("postid", postid)] if postid else []
+
+        list_ops = []
+        for path_md in self.list_delete:
+            keys = [("path", path_md)] + postid_key(path_md)
+            list_ops.append(_Operation(f"delete:{path_md}", mgr.delete_blog,
+                                       (path_md,), {}, keys))
+        for path_from, path_to, kwargs in self.list_move:
+            keys = [("path", path_from), ("path", path_to)] + postid_key(path_from)
+            list_ops.append(_Operation(f"move:{path_from}", mgr.move_blog,
+                                       (path_from, path_to), kwargs, keys))
+        for path_md, kwargs in self.list_post:
+            keys = [("path", path_md)] + postid_key(path_md)
+            list_ops.append(_Operation(f"post:{path_md}", mgr.post_blog,
+                                       (path_md,), kwargs, keys, path_post=path_md))
+
+        dict_last = {}
+        for op in list_ops:
+            for key in op.keys:
+                if key in dict_last and dict_last[key] not in op.deps:
+                    op.deps.append(dict_last[key])
+                dict_last[key] = op
+        return list_ops
+
+    async def _acquire_token(self):
+        while not self.bucket.try_acquire():
+            time_wait = self.bucket.wait_time()
+            if not self.num_waiting:
+                print(f"cnblog限制了发送频率，新发布的blog将在{time_wait:.0f}s后继续...")
+            self.num_waiting += 1
+            try:
+                await asyncio.sleep(time_wait)
+            finally:
+                self.num_waiting -= 1
+
+    async def _run_op(self, op, executor):
+        loop = asyncio.get_running_loop()
+        try:
+            for dep in op.deps:
+                await dep.done.wait()
+                if dep.error:
+                    raise PushFailed(f"前序操作失败【{dep.name}】")
+
+            kwargs = op.kwargs
+            is_new = op.path_post and not self._db.get_postid(op.path_post)
+            if is_new:
+                kwargs = dict(kwargs, wait_limit=False)
+            while True:
+                if is_new:
+                    await self._acquire_token()
+                try:
+                    await loop.run_in_executor(executor, partial(op.func, *op.args, **kwargs))
+                except FrequencyLimited:
+                    # 本地计时与服务器不一致（例如刚刚有过其他发布），重新排队
+                    self.bucket.drain()
+                else:
+                    break
+        except Exception as e:
+            op.error = e
+            print(f"!! 操作失败【{op.name}】: {e}")
+        finally:
+            op.done.set()
+
+    async def _run(self):
+        self._db = self.cnblog_mgr.db
+        list_ops = self._build()
+        # 整个推送只提交一次；中途出错时保留已完成的记录（对应的文章已发布）
+        with self._db.batch(), \
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*(self._run_op(op, executor) for op in list_ops))
+        return [op for op in list_ops if op.error]
+
+    def run(self):
+        list_failed = asyncio.run(self._run())
+        if list_failed:
+            raise PushFailed("以下操作未完成: " + ", ".join(op.name for op in list_failed))
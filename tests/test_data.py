@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+""" ArticlesDB的事务范围及多线程读写的测试
+
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import threading
+from time import sleep
+
+import pytest
+
+DIR_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_ROOT)
+
+from data import ArticlesDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = ArticlesDB(str(tmp_path / "blogs.db"))
+    yield db
+    db.close()
+
+
+def test_rollback_keeps_other_threads_writes(db):
+    """ 一个线程的事务回滚时，其他线程同时进行的写入不受影响 """
+    entered = threading.Event()
+
+    def scope_a():
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.insert_item("a.md", "41", "A", None, [])
+                entered.set()
+                sleep(0.2)  # 期间线程B写入
+                raise RuntimeError("fail")
+
+    thread_a = threading.Thread(target=scope_a)
+    thread_a.start()
+    entered.wait()
+    thread_b = threading.Thread(target=db.insert_item, args=("b.md", "42", "B", None, []))
+    thread_b.start()
+    thread_a.join()
+    thread_b.join()
+
+    assert [row[:2] for row in db.select()] == [("b.md", "42")]
+
+
+def test_scope_reads_own_writes(db):
+    with db.transaction():
+        db.insert_item("a.md", "41", "A", None, [])
+        assert db.get_postid("a.md") == "41"
+    assert db.get_postid("a.md") == "41"
+
+
+def test_checkpoint_before_copy(db, tmp_path):
+    """ checkpoint之后，单独复制数据库文件（如git add）即包含全部已提交的写入 """
+    db.insert_item("a.md", "41", "A", None, [])
+    db.checkpoint()
+    assert os.path.getsize(tmp_path / "blogs.db-wal") == 0
+
+    path_copy = str(tmp_path / "copy.db")
+    shutil.copyfile(tmp_path / "blogs.db", path_copy)
+    conn = sqlite3.connect(path_copy)
+    try:
+        assert conn.execute("SELECT filepath, postid FROM essay; ").fetchall() == [("a.md", "41")]
+    finally:
+        conn.close()
+
+
+def test_batch_commits_once(db, tmp_path):
+    """ batch()内各线程的写入在退出时一次提交；其中失败的transaction()只撤销自身的写入 """
+    def count_committed():
+        conn = sqlite3.connect(str(tmp_path / "blogs.db"))
+        try:
+            return conn.execute("SELECT count(*) FROM essay; ").fetchone()[0]
+        finally:
+            conn.close()
+
+    def failing_scope():
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.insert_item("c.md", "43", "C", None, [])
+                raise RuntimeError("fail")
+
+    with db.batch():
+        db.insert_item("a.md", "41", "A", None, [])
+        list_threads = [threading.Thread(target=db.insert_item, args=("b.md", "42", "B", None, [])),
+                        threading.Thread(target=failing_scope)]
+        for thread in list_threads:
+            thread.start()
+        for thread in list_threads:
+            thread.join()
+        assert count_committed() == 0
+        assert db.select() == []  # 读操作不经由writer，看不到尚未提交的写入
+
+    assert sorted(row[0] for row in db.select()) == ["a.md", "b.md"]
+    assert count_committed() == 2
+
+
+def test_search_short_terms(db):
+    """ 少于3个字符的词经二元组索引匹配，重新索引或删除文章后不再命中旧内容 """
+    if not db.has_grams:
+        pytest.skip("当前sqlite未支持FTS5")
+    db.insert_items([("a.md", "41", "A", None, []), ("b.md", "42", "B", None, [])])
+    db.index_post("a.md", "协程", ["Python"], "用中文写的笔记，C# 示例")
+    db.index_post("b.md", "英文", [], "english notes")
+
+    def found(query):
+        return sorted(item["filepath"] for item in db.search(query))
+
+    assert found("中文") == ["a.md"]
+    assert found("程") == ["a.md"]  # 连续字符串的末字
+    assert found("文") == ["a.md", "b.md"]
+    assert found("py") == ["a.md"]  # 匹配标签Python之中的子串
+    assert found("C#") == ["a.md"]  # 含符号，逐篇子串过滤
+    assert found("中文 notes") == []
+    assert found("文 notes") == ["b.md"]
+
+    db.index_post("a.md", "协程", [], "改写后的正文")
+    assert found("中文") == []
+    assert found("改写") == ["a.md"]
+    db.del_item(path="a.md")
+    assert found("改写") == []
+    assert found("文") == ["b.md"]
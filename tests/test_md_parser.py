@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+""" 块结构识别及增量索引的测试
+
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import random
+
+DIR_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_ROOT)
+
+from md_parser import MarkdownParser
+
+
+def load(tmp_path, text):
+    path_md = tmp_path / "note.md"
+    path_md.write_text(text, encoding="utf8")
+    md = MarkdownParser()
+    md.load_file(str(path_md))
+    return md
+
+
+def test_nested_fence(tmp_path):
+    """ 较长的围栏内可包含较短的围栏，后者不结束代码块 """
+    md = load(tmp_path, "````markdown\n```python\n![x](in_code.png)\n```\n````\n\n![y](real.png)\n")
+    assert md.get_images("local", force_abspath=False) == {6: "real.png"}
+    assert md.blocks == [(0, 4, "fence")]
+
+
+def test_fence_close(tmp_path):
+    """ 结束围栏须为同一字符、不短于开始围栏，且行内无其他内容 """
+    md = load(tmp_path, "~~~\n```\n~~~ text\n![a](a.png)\n~~~~\n![b](b.png)\n")
+    assert md.get_images("local", force_abspath=False) == {5: "b.png"}
+    assert md.blocks == [(0, 4, "fence")]
+
+    md = load(tmp_path, "```\n![a](a.png)\n")
+    assert md.get_images("local", force_abspath=False) == {}
+
+
+def test_incremental_index(tmp_path):
+    """ 随机编辑后，增量维护的索引应与重新扫描全文的结果一致 """
+    pool = ["text\n", "\n", "    ind\n", "- li\n", "```\n", "````\n", "~~~\n", "``` py\n",
+            "<!--\n", "-->\n", "![](r.png)\n", "    ![](i.png)\n", "![](u) <!-- b -->\n", "# h\n"]
+    rand = random.Random(19)
+    for _ in range(1000):
+        md = load(tmp_path, "".join(rand.choice(pool) for _ in range(12)))
+        for _ in range(6):
+            md.unlock_text()
+            num_lines = len(md.get_text())
+            op = rand.random()
+            if op < 0.5:
+                md.modify_text(rand.randrange(num_lines), rand.choice(pool))
+            elif op < 0.8:
+                md.insert_text(rand.randrange(num_lines + 1), rand.choice(pool))
+            elif num_lines > 1:
+                md.pop_text(rand.randrange(num_lines))
+
+            index = dict(md._get_index())
+            ref = MarkdownParser()
+            ref._clear_metadata()
+            ref.set_text(list(md.get_text()))
+            assert index == dict(ref._get_index())
+            assert md.blocks == ref.blocks
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import base64
+import http.client
+import threading
+import xmlrpc.client
+from abc import ABC, abstractmethod
+from urllib.parse import urlsplit
+
+# 复用的连接可能已被服务器关闭，此类错误重新建立连接后重试一次
+_STALE_ERRORS = (http.client.RemoteDisconnected,
+                 http.client.BadStatusLine,
+                 ConnectionResetError,
+                 ConnectionAbortedError,
+                 BrokenPipeError)
+
+
+class KeepAliveTransport(xmlrpc.client.Transport):
+    """ 线程安全的keep-alive连接池，供ServerProxy在多线程中共享
+        pool_size: 每个host最多保留的空闲连接数
+        timeout: socket超时（秒）
+    """
+    def __init__(self, use_https=False, timeout=None, pool_size=4,
+                 use_datetime=False, use_builtin_types=False):
+        super().__init__(use_datetime, use_builtin_types)
+        self.use_https = use_https
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool = {}  # host: [idle_connections]
+        self._lock = threading.Lock()
+        self.num_opened = 0
+        self.num_reused = 0
+        self.verbose = False
+
+    def stats(self):
+        return {"opened": self.num_opened, "reused": self.num_reused}
+
+    def _new_connection(self, host):
+        chost, _, _ = self.get_host_info(host)
+        if self.use_https:
+            import ssl
+            context = ssl.create_default_context()
+            conn = http.client.HTTPSConnection(chost, timeout=self.timeout,
+                                               context=context)
+        else:
+            conn = http.client.HTTPConnection(chost, timeout=self.timeout)
+        with self._lock:
+            self.num_opened += 1
+        return conn
+
+    def _acquire(self, host):
+        """ return (connection, is_reused) """
+        with self._lock:
+            list_idle = self._pool.get(host)
+            if list_idle:
+                self.num_reused += 1
+                return list_idle.pop(), True
+        return self._new_connection(host), False
+
+    def _release(self, host, conn):
+        with self._lock:
+            list_idle = self._pool.setdefault(host, [])
+            if len(list_idle) < self.pool_size:
+                list_idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            list_conns = [c for list_idle in self._pool.values() for c in list_idle]
+            self._pool.clear()
+        for conn in list_conns:
+            conn.close()
+
+    def request(self, host, handler, request_body, verbose=False):
+        return self._request(host, handler, lambda: request_body,
+                             len(request_body), verbose)
+
+    def request_streaming(self, host, handler, request, verbose=False):
+        """ request: StreamingRequest，请求体逐块生成并发送 """
+        return self._request(host, handler, request.iter_bytes,
+                             request.length, verbose)
+
+    def _request(self, host, handler, make_body, content_length, verbose):
+        """ make_body() -> bytes或bytes迭代器；重试时重新生成 """
+        for attempt in (0, 1):
+            conn, is_reused = self._acquire(host)
+            try:
+                return self._single_request(conn, host, handler, make_body(),
+                                            verbose, content_length)
+            except _STALE_ERRORS:
+                conn.close()
+                if not is_reused or attempt:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def _send(self, conn, host, handler, request_body, content_length, verbose):
+        _, extra_headers, _ = self.get_host_info(host)
+        if verbose:
+            conn.set_debuglevel(1)
+        conn.putrequest("POST", handler, skip_accept_encoding=True)
+        conn.putheader("Content-Type", "text/xml")
+        conn.putheader("User-Agent", self.user_agent)
+        conn.putheader("Content-Length", str(content_length))
+        for key, value in (extra_headers or []):
+            conn.putheader(key, value)
+        conn.endheaders(request_body)
+
+    def _single_request(self, conn, host, handler, request_body, verbose,
+                        content_length):
+        self._send(conn, host, handler, request_body, content_length, verbose)
+        resp = conn.getresponse()
+        if resp.status != 200:
+            resp.read()
+            conn.close()
+            raise xmlrpc.client.ProtocolError(host + handler, resp.status,
+                                              resp.reason, dict(resp.getheaders()))
+        result = self.parse_response(resp)
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(host, conn)
+        return result
+
+
+class StreamParam(ABC):
+    """ 流式参数: 不在内存中整体序列化，发送请求时逐块写入
+        tag: 序列化时的XML-RPC类型标签
+    """
+    tag = None
+
+    @abstractmethod
+    def length(self):
+        """ 编码后的字节数，用于预先计算Content-Length """
+
+    @abstractmethod
+    def iter_bytes(self):
+        """ 逐块生成编码后的内容 """
+
+
+class Base64File(StreamParam):
+    """ 以<base64>形式流式发送的文件内容，内存占用与文件大小无关 """
+    tag = "base64"
+
+    def __init__(self, path_file, chunk_size=3 << 15):
+        self.path_file = path_file
+        self.chunk_size = chunk_size - chunk_size % 3  # 3的整数倍，分块编码后可直接拼接
+        self.size = os.path.getsize(path_file)
+
+    def length(self):
+        return (self.size + 2) // 3 * 4
+
+    def iter_bytes(self):
+        with open(self.path_file, "rb") as fp:
+            for chunk in iter(lambda: fp.read(self.chunk_size), b""):
+                yield base64.b64encode(chunk)
+
+
+class TextStream(StreamParam):
+    """ 以<string>形式流式发送的文本行（如MarkdownParser的行缓冲），
+        按块转义、编码，无需拼接整段文本
+    """
+    tag = "string"
+
+    def __init__(self, list_lines, chunk_size=1 << 16):
+        self.lines = list_lines
+        self.chunk_size = chunk_size
+
+    def _iter_chunks(self):
+        list_chunk, size = [], 0
+        for line in self.lines:
+            list_chunk.append(line)
+            size += len(line)
+            if size >= self.chunk_size:
+                yield xmlrpc.client.escape("".join(list_chunk)).encode("utf-8")
+                list_chunk, size = [], 0
+        if list_chunk:
+            yield xmlrpc.client.escape("".join(list_chunk)).encode("utf-8")
+
+    def length(self):
+        return sum(len(chunk) for chunk in self._iter_chunks())
+
+    def iter_bytes(self):
+        return self._iter_chunks()
+
+
+class _StreamingMarshaller(xmlrpc.client.Marshaller):
+    """ 将StreamParam序列化为占位符，其余参数与Marshaller一致 """
+    dispatch = dict(xmlrpc.client.Marshaller.dispatch)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.streams = []
+
+    def dump_stream(self, value, write):
+        write(f"<value><{value.tag}>\0{len(self.streams)}\0</{value.tag}></value>\n")
+        self.streams.append(value)
+
+    dispatch[Base64File] = dump_stream
+    dispatch[TextStream] = dump_stream
+
+
+class StreamingRequest:
+    """ methodCall请求体: 由普通XML片段与StreamParam交替组成，
+        可预先计算Content-Length，发送时逐块生成
+    """
+    _re_placeholder = re.compile("\0(\\d+)\0")
+
+    def __init__(self, methodname, params):
+        marshaller = _StreamingMarshaller("utf-8", allow_none=True)
+        text = ("<?xml version='1.0'?>\n<methodCall>\n<methodName>{}</methodName>\n{}"
+                "</methodCall>\n").format(methodname, marshaller.dumps(params))
+        self.parts = []
+        for idx, part in enumerate(self._re_placeholder.split(text)):
+            if idx % 2:
+                self.parts.append(marshaller.streams[int(part)])
+            elif part:
+                self.parts.append(part.encode("utf-8"))
+        self.length = sum(p.length() if isinstance(p, StreamParam) else len(p)
+                          for p in self.parts)
+
+    def iter_bytes(self):
+        for part in self.parts:
+            if isinstance(part, StreamParam):
+                yield from part.iter_bytes()
+            else:
+                yield part
+
+
+class StreamingServerProxy(xmlrpc.client.ServerProxy):
+    """ 在ServerProxy基础上，支持含StreamParam参数的调用 """
+    def __init__(self, uri, transport, **kwargs):
+        super().__init__(uri, transport=transport, **kwargs)
+        parts = urlsplit(uri)
+        self._stream_host = parts.netloc
+        self._stream_handler = (parts.path or "/RPC2") + (f"?{parts.query}" if parts.query else "")
+
+    def call_streaming(self, methodname, *params):
+        request = StreamingRequest(methodname, params)
+        response = self("transport").request_streaming(
+                        self._stream_host, self._stream_handler, request)
+        if len(response) == 1:
+            response = response[0]
+        return response
+
+
+def make_server_proxy(url, timeout=None, pool_size=4,
+                      transport_class=KeepAliveTransport, **kwargs):
+    """ 使用KeepAliveTransport的ServerProxy """
+    use_https = urlsplit(url).scheme == "https"
+    transport = transport_class(use_https, timeout, pool_size)
+    return StreamingServerProxy(url, transport, **kwargs)
+
+
+if __name__ == "__main__":
+    def test():
+        from socketserver import ThreadingMixIn
+        from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+        class Handler(SimpleXMLRPCRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持keep-alive
+
+        class Server(ThreadingMixIn, SimpleXMLRPCServer):
+            daemon_threads = True
+
+        server = Server(("127.0.0.1", 0), Handler, logRequests=False)
+        server.register_function(lambda x, y: x + y, "add")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        proxy = make_server_proxy("http://127.0.0.1:{}/".format(server.server_address[1]),
+                                  timeout=5)
+        server.register_function(lambda b: len(b.data), "length")
+        server.register_function(lambda d: d["text"], "echo")
+        for i in range(10):
+            assert proxy.add(i, 1) == i + 1
+        assert proxy.call_streaming("length", Base64File(__file__)) == os.path.getsize(__file__)
+        list_lines = ["a < b && c > d\n", "中文\n"] * 10000
+        assert proxy.call_streaming("echo", {"text": TextStream(list_lines)}) == "".join(list_lines)
+        print(proxy("transport").stats())  # {'opened': 1, 'reused': 11}
+        server.shutdown()
+
+    test()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import hashlib
+
+CHUNK_SIZE = 1 << 16
+
+def file_digest(path_file, chunk_size=CHUNK_SIZE):
+    """ 分块读取，计算文件内容的sha1 """
+    sha1 = hashlib.sha1()
+    with open(path_file, "rb") as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def text_digest(*list_text):
+    """ 计算多段文本的sha1（各段之间以\\0分隔） """
+    sha1 = hashlib.sha1()
+    for text in list_text:
+        sha1.update(text.encode("utf8"))
+        sha1.update(b"\0")
+    return sha1.hexdigest()
+
+def stream_digest(*list_parts):
+    """ 同text_digest，但各段也可以是文本片段的迭代器（逐块计算，无需拼接整段文本） """
+    sha1 = hashlib.sha1()
+    for part in list_parts:
+        for text in ([part] if isinstance(part, str) else part):
+            sha1.update(text.encode("utf8"))
+        sha1.update(b"\0")
+    return sha1.hexdigest()
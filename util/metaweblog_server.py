@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+""" 本地MetaWeblog模拟服务器，用于测试及性能评估（无需访问cnblogs.com）
+
+    python util/metaweblog_server.py --port 8000 --latency 0.05
+    .cnblog.json: "blog_url": "http://127.0.0.1:8000/"
+"""
+
+import threading
+import xmlrpc.client
+from datetime import datetime
+from socketserver import ThreadingMixIn
+from time import sleep, monotonic
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持keep-alive
+    rpc_paths = ()  # 接受任意路径，例如 /metaweblog/brt2
+
+
+class _ThreadingServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class MetaWeblogServer:
+    """ latency: 每次调用的模拟延迟（秒），或 {method_name: 秒}
+        newpost_interval: 模拟cnblog的发布频率限制（<Fault 500），0为不限制
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0, newpost_interval=0):
+        self.latency = latency
+        self.newpost_interval = newpost_interval
+        self.posts = {}  # postid: struct_post
+        self.media = {}  # url: bytes
+        self.num_calls = {}
+        self._lock = threading.Lock()
+        self._next_id = 10000000
+        self._time_newpost = None
+
+        self.server = _ThreadingServer((host, port), _RequestHandler,
+                                       logRequests=False, allow_none=True)
+        dict_methods = {
+            "blogger.getUsersBlogs": self.getUsersBlogs,
+            "blogger.deletePost": self.deletePost,
+            "metaWeblog.newPost": self.newPost,
+            "metaWeblog.editPost": self.editPost,
+            "metaWeblog.getPost": self.getPost,
+            "metaWeblog.getRecentPosts": self.getRecentPosts,
+            "metaWeblog.newMediaObject": self.newMediaObject,
+        }
+        for name, func in dict_methods.items():
+            self.server.register_function(self._wrap(name, func), name)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _wrap(self, name, func):
+        def wrapper(*args):
+            with self._lock:
+                self.num_calls[name] = self.num_calls.get(name, 0) + 1
+            latency = self.latency.get(name, 0) if isinstance(self.latency, dict) else self.latency
+            if latency:
+                sleep(latency)
+            return func(*args)
+        return wrapper
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _new_postid(self):
+        with self._lock:
+            self._next_id += 1
+            return str(self._next_id)
+
+    def _get(self, postid):
+        try:
+            return self.posts[str(postid)]
+        except KeyError:
+            raise xmlrpc.client.Fault(500, f"post not found: {postid}")
+
+    def getUsersBlogs(self, app_key, username, password):
+        return [{"blogid": "1", "url": self.url, "blogName": username}]
+
+    def newPost(self, blog_id, username, password, struct_post, publish):
+        if self.newpost_interval:
+            with self._lock:
+                now = monotonic()
+                if self._time_newpost and now - self._time_newpost < self.newpost_interval:
+                    raise xmlrpc.client.Fault(500, "30秒内只能发布1篇博文，请稍候发布")
+                self._time_newpost = now
+        postid = self._new_postid()
+        post = dict(struct_post)
+        post.update({
+            "postid": postid,
+            "dateCreated": xmlrpc.client.DateTime(datetime.now()),
+            "link": f"{self.url}p/{postid}.html",
+        })
+        self.posts[postid] = post
+        return postid
+
+    def editPost(self, postid, username, password, struct_post, publish):
+        post = self._get(postid)
+        post.update(struct_post)
+        return True
+
+    def deletePost(self, app_key, postid, username, password, publish):
+        self._get(postid)
+        del self.posts[str(postid)]
+        return True
+
+    def getPost(self, postid, username, password):
+        return self._get(postid)
+
+    def getRecentPosts(self, blog_id, username, password, num):
+        list_posts = sorted(self.posts.values(), key=lambda p: int(p["postid"]), reverse=True)
+        return list_posts[:num]
+
+    def newMediaObject(self, blog_id, username, password, file):
+        url = f"{self.url}images/{self._new_postid()}-{file['name']}"
+        self.media[url] = file["bits"].data
+        return {"url": url}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser("metaweblog_server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0, help="每次调用的模拟延迟（秒）")
+    parser.add_argument("--newpost-interval", type=float, default=0, help="模拟发布频率限制（秒）")
+    args = parser.parse_args()
+
+    server = MetaWeblogServer(port=args.port, latency=args.latency,
+                              newpost_interval=args.newpost_interval)
+    print(f"MetaWeblog模拟服务器: {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass